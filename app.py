@@ -1,33 +1,92 @@
+import importlib.util
 import json
+from functools import partial
 from typing import Dict, Any, List
 
 import numpy as np
 import pandas as pd
-import plotly.express as px
 import streamlit as st
 
 from defaults import DEFAULTS, SOURCES, LANGUAGE
 from utils.formatting import euro, pct, badge
-from utils.charts import stacked_bar_overview
-from models.rail import RailInputs, compute_rail_monthly
+from utils.charts import binned_histogram, histogram_counts, stacked_bar_overview
+from utils.cache import MODEL_CACHE
+from utils.export import EXPORT_FORMATS, export_frame, export_run, wide_projections
+from utils.library import SCENARIO_LIBRARY, parse_tags, scenario_hash
+from utils.mcstore import MC_STORE
+from utils.profiling import PROFILER
+from models.rail import RailFunnel, RailInputs, compute_rail_monthly, rail_funnel
 from models.retail import RetailInputs, RetailMethod, compute_retail_monthly, simulate_roundup_distribution
-from models.montecarlo import run_monte_carlo
+from models.goalseek import ASK_TYPES, GOAL_PARAMS, goal_seek, goal_seek_probability
+from models.ab import plan_tests, rail_daily_traffic, retail_daily_traffic
+from models.microsim import compare_with_analytic, simulate_retail_transactions
+from models.moments import analytic_check, moment_bands
+from models.montecarlo import run_monte_carlo_stored, run_monte_carlo_streaming
+from models.sensitivity import morris_effects, sobol_indices
+from models.units import (
+    aggregate_units, load_units, rail_unit_forecast, retail_unit_forecast, sample_rail_routes, sample_retail_stores,
+    unit_monte_carlo, units_from_frame,
+)
+from models.scenario import (
+    combine_projections, compare_scenarios, rail_inputs_from_assumptions, retail_inputs_from_assumptions,
+    summarize_projections,
+)
+from report import REPORT_JOBS, build_report, cached_report, report_key
 
 
 st.set_page_config(page_title="MSF Micro-donations Simulator", layout="wide")
 
+# Key prefixes of the input widgets (sliders, number inputs, selects, checkboxes, toggles) each
+# tab draws, whose values persist_widget_state carries across runs. Buttons, download buttons
+# and file uploaders refuse values set through st.session_state, so their keys never start
+# with one of these
+TAB_INPUT_PREFIXES = {
+    "Overview": ("overview_",),
+    "Rail": ("rail_",),
+    "Retail": ("retail_",),
+    "Sensitivity": ("mc_",),
+    "A/B Lab": ("ab_",),
+    "Library": ("library_",),
+    "Partners": ("partners_",),
+    "Assumptions": ("assump_", "assumptions_"),
+    "Download": ("export_",),
+}
+
+# Labels for models.montecarlo.SAMPLING_MODES
+SAMPLING_LABELS = {
+    "random": "Pseudo-random",
+    "antithetic": "Antithetic pairs",
+    "lhs": "Latin hypercube",
+    "sobol": "Scrambled Sobol",
+}
+# Labels for utils.export.EXPORT_FORMATS
+EXPORT_LABELS = {"csv": "CSV", "parquet": "Parquet", "arrow": "Arrow IPC"}
+
 
 def init_state() -> None:
     if "assumptions" not in st.session_state:
         st.session_state.assumptions = json.loads(json.dumps(DEFAULTS))
+    # Tabs that are never opened still feed Overview, Sensitivity and Download
     if "rail_inputs" not in st.session_state:
-        st.session_state.rail_inputs = None
+        st.session_state.rail_inputs = rail_inputs_from_assumptions(st.session_state.assumptions)
     if "retail_inputs" not in st.session_state:
-        st.session_state.retail_inputs = None
+        st.session_state.retail_inputs = retail_inputs_from_assumptions(st.session_state.assumptions)
     if "months" not in st.session_state:
         st.session_state.months = 12
 
 
+def persist_widget_state() -> None:
+    # Streamlit drops the state of widgets that were not rendered in a run; re-assigning
+    # the values keeps inputs of hidden tabs alive when only the active tab is drawn. The
+    # tab about to be drawn is skipped: its widgets pass value=, and a widget whose value
+    # was also set through the Session State API in the same run makes Streamlit warn
+    if not st.session_state.get("lazy_tabs", True):
+        return
+    active = st.session_state.get("active_tab", TAB_NAMES[0])
+    hidden = tuple(prefix for tab, prefixes in TAB_INPUT_PREFIXES.items() if tab != active for prefix in prefixes)
+    for key in list(st.session_state):
+        if key.startswith(hidden):
+            st.session_state[key] = st.session_state[key]
 
 
 def sources_tab() -> None:
@@ -69,8 +128,9 @@ def sources_tab() -> None:
 
 
 def overview_tab(rail_df: pd.DataFrame, retail_df: pd.DataFrame) -> None:
-    rail_annual = rail_df[rail_df["metric"] == "net"].groupby("year")["value"].sum().sum()
-    retail_annual = retail_df[(retail_df["metric"] == "net") & (retail_df["channel"] == "all")].groupby("year")["value"].sum().sum()
+    with PROFILER.stage("dataframe.overview"):
+        rail_annual = rail_df[(rail_df["metric"] == "net") & (rail_df["operator"] == "all")].groupby("year")["value"].sum().sum()
+        retail_annual = retail_df[(retail_df["metric"] == "net") & (retail_df["channel"] == "all")].groupby("year")["value"].sum().sum()
     total_annual = rail_annual + retail_annual
     msf_baseline = st.session_state.assumptions["msf_italy"]["fundraising_2024_eur"]
 
@@ -93,20 +153,54 @@ def overview_tab(rail_df: pd.DataFrame, retail_df: pd.DataFrame) -> None:
     share = (display_total / msf_baseline) if msf_baseline > 0 else 0
     st.metric("% of MSF Italy fundraising 2024", pct(share))
 
-    fig = stacked_bar_overview(
-        rail=0 if retail_only else rail_annual,
-        retail=retail_annual,
-        baseline=msf_baseline,
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    with PROFILER.stage("figures.overview"):
+        fig = stacked_bar_overview(
+            rail=0 if retail_only else rail_annual,
+            retail=retail_annual,
+            baseline=msf_baseline,
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
     if retail_only:
         st.info("Retail-only scenario: rail contribution excluded from totals above.")
     else:
         st.info("Compliance: opt-in donations only. No pre-ticked boxes (EU directive).")
 
+    goal_seek_section(msf_baseline, include_rail=not retail_only)
 
-def rail_tab() -> pd.DataFrame:
+
+def goal_seek_section(msf_baseline: float, include_rail: bool) -> None:
+    with st.expander("Goal seek: what does it take to reach a target?"):
+        c1, c2 = st.columns(2)
+        mode = c1.radio("Target", ["% of MSF Italy fundraising 2024", "Net €"], horizontal=True, key="overview_goal_mode")
+        if mode == "Net €":
+            target = c2.number_input("Target net €", min_value=0.0, value=50_000_000.0, step=1_000_000.0, key="overview_goal_eur")
+        else:
+            target = c2.number_input("Target share %", min_value=0.0, max_value=1000.0, value=50.0, step=1.0, key="overview_goal_pct") / 100.0 * msf_baseline
+        options = [name for name in GOAL_PARAMS if include_rail or name.startswith("retail.")]
+        free = c1.selectbox("Solve for", options, format_func=lambda name: GOAL_PARAMS[name][0], key="overview_goal_free")
+        compare_asks = c2.checkbox("Compare ask types", key="overview_goal_asks", disabled=not include_rail)
+        uncertain = c1.checkbox("Under Monte Carlo uncertainty", key="overview_goal_mc")
+        probability = c2.slider("Required P(total ≥ target) %", 50, 99, 80, key="overview_goal_prob", disabled=not uncertain) / 100.0
+
+        args = (st.session_state.rail_inputs, st.session_state.retail_inputs, st.session_state.months, target, free)
+        sweep = {"sweep": "rail.ask_type", "sweep_values": ASK_TYPES} if compare_asks and include_rail else {}
+        if uncertain:
+            result = MODEL_CACHE.call(goal_seek_probability, *args, probability=probability, include_rail=include_rail, **sweep)
+        else:
+            result = MODEL_CACHE.call(goal_seek, *args, include_rail=include_rail, **sweep)
+
+        initiative, field = free.split(".", 1)
+        current = getattr(st.session_state.rail_inputs if initiative == "rail" else st.session_state.retail_inputs, field)
+        st.caption(f"Target {euro(target)} over {st.session_state.months} months; current {GOAL_PARAMS[free][0].lower()}: {pct(current)}.")
+        formats = {free: lambda v: "not reachable" if np.isnan(v) else pct(v), "total_net": euro, "probability": pct}
+        st.dataframe(
+            result.style.format({k: f for k, f in formats.items() if k in result}, na_rep="-"),
+            use_container_width=True, hide_index=True,
+        )
+
+
+def rail_tab() -> RailFunnel:
     st.subheader("Rail module (Trenitalia + Italo)")
 
     a = st.session_state.assumptions
@@ -168,6 +262,11 @@ def rail_tab() -> pd.DataFrame:
             for i in range(12):
                 seasonality.append(cols[i % 4].number_input(f"m{i+1}", min_value=0.1, max_value=2.0, value=float(a["rail"]["seasonality"][i]), step=0.05, key=f"rail_season_{i}"))
 
+        with st.popover("Year-on-year growth (horizons > 12 months)"):
+            ridership_growth = st.number_input("Ridership growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["rail"].get("ridership_growth_pct", 0)), step=1.0, key="rail_ridership_growth") / 100.0
+            digital_share_growth = st.number_input("Digital share growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["rail"].get("digital_share_growth_pct", 0)), step=1.0, key="rail_digital_growth") / 100.0
+            rail_optin_growth = st.number_input("Opt-in growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["rail"].get("optin_growth_pct", 0)), step=1.0, key="rail_optin_growth") / 100.0
+
         processor = st.selectbox("Processor & fees", options=["Adyen Giving", "Stripe", "Nexi"], index=["Adyen Giving", "Stripe", "Nexi"].index(a["fees"]["processor"]), key="rail_processor")
         fee_rate = 0.0
         fee_fixed = 0.0
@@ -177,44 +276,59 @@ def rail_tab() -> pd.DataFrame:
             fee_rate = st.number_input("% fee", min_value=0.0, max_value=5.0, value=float(a["fees"]["rate_pct"]), key="rail_fee_rate") / 100.0
             fee_fixed = st.number_input("Fixed € per donation", min_value=0.0, max_value=1.0, value=float(a["fees"]["fixed_eur"]), key="rail_fee_fixed")
 
-    inputs = RailInputs(
-        trenitalia_riders=trenitalia_riders,
-        italo_riders=italo_riders,
-        digital_share=digital_share,
-        eligible_share=eligible_share,
-        ask_type=ask_type,
-        choice_share_eur1=choice_share_eur1,
-        optin_web_1=optin_web_1,
-        optin_web_2=optin_web_2,
-        optin_pos=optin_pos,
-        seasonality=seasonality,
-        fee_rate=fee_rate,
-        fee_fixed=fee_fixed,
-        processor=processor,
-    )
+    with PROFILER.stage("validate.rail_inputs"):
+        inputs = RailInputs(
+            trenitalia_riders=trenitalia_riders,
+            italo_riders=italo_riders,
+            digital_share=digital_share,
+            eligible_share=eligible_share,
+            ask_type=ask_type,
+            choice_share_eur1=choice_share_eur1,
+            optin_web_1=optin_web_1,
+            optin_web_2=optin_web_2,
+            optin_pos=optin_pos,
+            seasonality=seasonality,
+            fee_rate=fee_rate,
+            fee_fixed=fee_fixed,
+            processor=processor,
+            ridership_growth=ridership_growth,
+            digital_share_growth=digital_share_growth,
+            optin_growth=rail_optin_growth,
+        )
     st.session_state.rail_inputs = inputs
 
-    monthly = compute_rail_monthly(inputs, months=months)
+    funnel = MODEL_CACHE.call(rail_funnel, inputs, months=months)
 
     # Charts
-    st.markdown("Funnel: Riders → Exposed → Donors → € net")
-    funnel_cols = ["riders", "eligible", "exposed_digital", "donors", "net"]
-    annual_funnel = monthly.groupby("metric")["value"].sum().reindex(funnel_cols).reset_index()
-    fig_funnel = px.funnel(annual_funnel, y="metric", x="value", title="Rail funnel (annual)")
-    st.plotly_chart(fig_funnel, use_container_width=True)
-
-    st.markdown("Monthly net € with seasonality")
-    monthly_net = monthly[(monthly["metric"] == "net") & (monthly["operator"] == "all")]
-    fig_line = px.line(monthly_net, x="month", y="value", title="Rail monthly net €")
-    st.plotly_chart(fig_line, use_container_width=True)
-
-    # Bars: Trenitalia vs Italo
-    bars = monthly[(monthly["metric"] == "net") & (monthly["operator"] != "all")]\
-        .groupby("operator")["value"].sum().reset_index()
-    fig_bars = px.bar(bars, x="operator", y="value", title="Annual net € by operator")
-    st.plotly_chart(fig_bars, use_container_width=True)
+    with PROFILER.stage("figures.rail"):
+        # Plotting libraries load with the first visible chart, not at app start
+        import plotly.express as px
+
+        st.markdown("Funnel: Riders → Exposed → Donors → € net")
+        funnel_cols = ["riders", "eligible", "exposed_digital", "donors", "net"]
+        annual_funnel = pd.DataFrame({
+            "metric": funnel_cols,
+            "value": [getattr(funnel, metric).sum() for metric in funnel_cols],
+        })
+        fig_funnel = px.funnel(annual_funnel, y="metric", x="value", title="Rail funnel (annual)")
+        st.plotly_chart(fig_funnel, use_container_width=True)
+
+        st.markdown("Monthly net € with seasonality")
+        fig_line = px.line(
+            x=np.arange(1, funnel.months + 1), y=funnel.net,
+            labels={"x": "month", "y": "value"}, title="Rail monthly net €",
+        )
+        st.plotly_chart(fig_line, use_container_width=True)
 
-    return monthly
+        # Bars: Trenitalia vs Italo
+        bars = funnel.operator_net()
+        fig_bars = px.bar(
+            x=list(bars), y=list(bars.values()),
+            labels={"x": "operator", "y": "value"}, title="Annual net € by operator",
+        )
+        st.plotly_chart(fig_bars, use_container_width=True)
+
+    return funnel
 
 
 def retail_tab() -> pd.DataFrame:
@@ -248,6 +362,10 @@ def retail_tab() -> pd.DataFrame:
 
         payment_card_share = st.slider("% card/contactless", 0, 100, int(a["retail"]["payment_card_share_pct"]), key="retail_card_share") / 100.0
 
+        with st.popover("Year-on-year growth (horizons > 12 months)"):
+            volume_growth = st.number_input("Transaction volume growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["retail"].get("volume_growth_pct", 0)), step=1.0, key="retail_volume_growth") / 100.0
+            retail_optin_growth = st.number_input("Opt-in growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["retail"].get("optin_growth_pct", 0)), step=1.0, key="retail_optin_growth") / 100.0
+
         processor = st.selectbox("Processor & fees", options=["Adyen Giving", "Stripe", "Nexi"], index=["Adyen Giving", "Stripe", "Nexi"].index(a["fees"]["processor"]), key="retail_processor")
         fee_rate = 0.0
         fee_fixed = 0.0
@@ -257,99 +375,443 @@ def retail_tab() -> pd.DataFrame:
             fee_rate = st.number_input("% fee", min_value=0.0, max_value=5.0, value=float(a["fees"]["rate_pct"]), key="retail_fee_rate") / 100.0
             fee_fixed = st.number_input("Fixed € per donation", min_value=0.0, max_value=1.0, value=float(a["fees"]["fixed_eur"]), key="retail_fee_fixed")
 
-    inputs = RetailInputs(
-        method=method,
-        monthly_spend=monthly_spend,
-        grocery_share=grocery_share,
-        avg_receipt=avg_receipt,
-        households=population_households,
-        daily_receipts=daily_receipts,
-        stores=stores,
-        active_days=active_days,
-        charm_prevalence=charm_prevalence,
-        optin=optin,
-        fee_rate=fee_rate,
-        fee_fixed=fee_fixed,
-        processor=processor,
-        triangular_min=roundup_min,
-        triangular_mode=roundup_mode,
-        triangular_max=roundup_max,
-        payment_card_share=payment_card_share,
-    )
+    with PROFILER.stage("validate.retail_inputs"):
+        inputs = RetailInputs(
+            method=method,
+            monthly_spend=monthly_spend,
+            grocery_share=grocery_share,
+            avg_receipt=avg_receipt,
+            households=population_households,
+            daily_receipts=daily_receipts,
+            stores=stores,
+            active_days=active_days,
+            charm_prevalence=charm_prevalence,
+            optin=optin,
+            fee_rate=fee_rate,
+            fee_fixed=fee_fixed,
+            processor=processor,
+            triangular_min=roundup_min,
+            triangular_mode=roundup_mode,
+            triangular_max=roundup_max,
+            payment_card_share=payment_card_share,
+            volume_growth=volume_growth,
+            optin_growth=retail_optin_growth,
+        )
     st.session_state.retail_inputs = inputs
 
-    monthly = compute_retail_monthly(inputs, months=months)
-
-    st.markdown("Histogram of simulated round-up per transaction (10k samples)")
-    samples = simulate_roundup_distribution(inputs, n=10000, seed=42)
-    fig_hist = px.histogram(x=samples, nbins=50, title="Round-up per transaction (€)")
-    fig_hist.update_xaxes(title_text="€ per transaction")
-    st.plotly_chart(fig_hist, use_container_width=True)
-
-    st.markdown("Funnel: transactions → opted-in → gross € → net of fees")
-    funnel_metrics = ["transactions", "donors", "gross", "net"]
-    wf = (
-        monthly[(monthly["channel"] == "all") & (monthly["metric"].isin(funnel_metrics))]
-        .groupby("metric")["value"]
-        .sum()
-        .reindex(funnel_metrics)
-        .reset_index()
-    )
-    fig_wf = px.funnel(wf, y="metric", x="value", title="Retail funnel (annual)")
-    st.plotly_chart(fig_wf, use_container_width=True)
+    monthly = MODEL_CACHE.call(compute_retail_monthly, inputs, months=months)
+
+    samples = MODEL_CACHE.call(simulate_roundup_distribution, inputs, n=10000, seed=42)
+
+    with PROFILER.stage("figures.retail"):
+        import plotly.express as px
 
-    scenario = monthly[(monthly["metric"] == "net") & (monthly["channel"].isin(["in_store", "online"]))] \
-        .groupby("channel")["value"].sum().reset_index()
-    fig_scn = px.bar(scenario, x="channel", y="value", title="Annual net € by channel")
-    st.plotly_chart(fig_scn, use_container_width=True)
+        st.markdown("Histogram of simulated round-up per transaction (10k samples)")
+        edges, counts = histogram_counts(samples, bins=50)
+        fig_hist = binned_histogram(edges, counts, "Round-up per transaction (€)", "€ per transaction")
+        st.plotly_chart(fig_hist, use_container_width=True)
+
+        st.markdown("Funnel: transactions → opted-in → gross € → net of fees")
+        funnel_metrics = ["transactions", "donors", "gross", "net"]
+        wf = (
+            monthly[(monthly["channel"] == "all") & (monthly["metric"].isin(funnel_metrics))]
+            .groupby("metric")["value"]
+            .sum()
+            .reindex(funnel_metrics)
+            .reset_index()
+        )
+        fig_wf = px.funnel(wf, y="metric", x="value", title="Retail funnel (annual)")
+        st.plotly_chart(fig_wf, use_container_width=True)
+
+        scenario = monthly[(monthly["metric"] == "net") & (monthly["channel"].isin(["in_store", "online"]))] \
+            .groupby("channel")["value"].sum().reset_index()
+        fig_scn = px.bar(scenario, x="channel", y="value", title="Annual net € by channel")
+        st.plotly_chart(fig_scn, use_container_width=True)
+
+    with st.expander("Transaction-level check"):
+        st.caption("Simulates every transaction of the horizon in fixed-size chunks (opt-in, charm pricing, channel, round-up) to validate the closed-form totals above.")
+        # Key outside the persisted prefixes: buttons cannot be set through session state
+        if st.button("Run transaction-level simulation", key="microsim_run"):
+            result = MODEL_CACHE.call(simulate_retail_transactions, inputs, months=months, seed=42)
+            st.dataframe(compare_with_analytic(result, monthly), use_container_width=True)
+            with PROFILER.stage("figures.retail_microsim"):
+                fig_dist = binned_histogram(
+                    result.edges, result.counts, "Round-up of charm-priced donor transactions", "€ per transaction", "transactions",
+                )
+                st.plotly_chart(fig_dist, use_container_width=True)
 
     return monthly
 
 
+def analytic_bands_section(include_rail: bool, include_retail: bool) -> None:
+    # Moment propagation takes well under a millisecond, so the bands follow the sliders on every rerun
+    st.markdown("#### Uncertainty bands (analytic, instant)")
+    c1, c2 = st.columns(2)
+    rail_scale = c1.slider("What-if: rail opt-in ×", 0.5, 2.0, 1.0, 0.05, key="mc_whatif_rail", disabled=not include_rail)
+    retail_scale = c2.slider("What-if: retail opt-in ×", 0.5, 2.0, 1.0, 0.05, key="mc_whatif_retail")
+    rail_inputs = st.session_state.rail_inputs.model_copy(update={
+        "optin_web_1": min(1.0, st.session_state.rail_inputs.optin_web_1 * rail_scale),
+        "optin_web_2": min(1.0, st.session_state.rail_inputs.optin_web_2 * rail_scale),
+    })
+    retail_inputs = st.session_state.retail_inputs.model_copy(update={
+        "optin": min(1.0, st.session_state.retail_inputs.optin * retail_scale),
+    })
+    bands = moment_bands(rail_inputs, retail_inputs, st.session_state.months, include_rail, include_retail)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("5th %", euro(bands.percentiles[0]))
+    m2.metric("Median", euro(bands.percentiles[1]))
+    m3.metric("95th %", euro(bands.percentiles[2]))
+    st.caption(
+        f"Mean {euro(bands.mean)}, sd {euro(bands.sd)}, skew {bands.skew:.2f}: the Monte Carlo input distributions "
+        "propagated exactly to three moments and matched to a shifted gamma. Turn on Monte Carlo for the full distribution."
+    )
+    if st.checkbox("Check against sampling (16k Sobol points)", value=False, key="mc_analytic_check"):
+        check = MODEL_CACHE.call(analytic_check, rail_inputs, retail_inputs, st.session_state.months, include_rail, include_retail)
+        st.dataframe(
+            check.style.format({"analytic": euro, "sampled": euro, "deviation": "{:+.2%}"}),
+            use_container_width=True, hide_index=True,
+        )
+
+
 def sensitivity_tab(rail_df: pd.DataFrame, retail_df: pd.DataFrame) -> None:
     st.subheader("Sensitivity")
-    mc_toggle = st.checkbox("Run Monte Carlo (fast)", value=False)
+    scenario = st.radio(
+        "Scenario focus",
+        ["Combined (rail + retail)", "Retail only"],
+        key="mc_scenario_focus",
+        horizontal=True,
+    )
+    include_rail = scenario == "Combined (rail + retail)"
+    include_retail = True
+
+    if include_rail and st.session_state.rail_inputs is None:
+        st.warning("Please configure the Rail tab first to include rail in Monte Carlo.")
+        return
+    if include_retail and st.session_state.retail_inputs is None:
+        st.warning("Please configure the Retail tab first to include retail in Monte Carlo.")
+        return
+    mc_toggle = st.checkbox("Run Monte Carlo (fast)", value=False, key="mc_toggle")
+    if not mc_toggle:
+        analytic_bands_section(include_rail, include_retail)
     if mc_toggle:
-        scenario = st.radio(
-            "Scenario focus",
-            ["Combined (rail + retail)", "Retail only"],
-            key="mc_scenario_focus",
-            horizontal=True,
+        adaptive = st.checkbox("Stop automatically when percentile bands converge", value=False, key="mc_adaptive")
+        if adaptive:
+            tolerance = st.slider("Tolerance (% of each percentile)", 0.5, 5.0, 1.0, 0.5, key="mc_tolerance") / 100.0
+            streamed = MODEL_CACHE.call(
+                run_monte_carlo_streaming,
+                st.session_state.rail_inputs,
+                st.session_state.retail_inputs,
+                st.session_state.months,
+                include_rail=include_rail,
+                include_retail=include_retail,
+                rel_tol=tolerance,
+                seed=123
+            )
+            edges, counts = streamed.summary.histogram(60)
+            perc = streamed.percentile_values
+            status = "converged" if streamed.converged else "stopped at the iteration cap"
+            st.caption(f"{streamed.iterations:,} iterations ({status}, ±{tolerance:.1%} target)")
+        else:
+            iterations = st.select_slider("Iterations", options=[2_000, 10_000, 100_000, 1_000_000], value=2_000, key="mc_iterations")
+            s1, s2 = st.columns(2)
+            sampling = s1.selectbox(
+                "Sampling", list(SAMPLING_LABELS), format_func=SAMPLING_LABELS.get, key="mc_sampling",
+                help="Scrambled Sobol and Latin hypercube points cover the input space evenly, so the bands settle with far fewer iterations.",
+            )
+            control_variates = s2.checkbox(
+                "Control variates", value=False, key="mc_control_variates",
+                help="Reweights the iterations so the sampled inputs match their known means.",
+            )
+            # Stored on disk by scenario, seed, iterations and sampling: reruns and restarts reopen the run
+            run = run_monte_carlo_stored(
+                MC_STORE,
+                st.session_state.rail_inputs,
+                st.session_state.retail_inputs,
+                st.session_state.months,
+                include_rail=include_rail,
+                include_retail=include_retail,
+                iterations=iterations,
+                seed=123,
+                sampling=sampling,
+                control_variates=control_variates,
+            )
+            weights = "weight" if control_variates else None
+            edges, counts = run.histogram("total_net", 60, weights=weights)
+            perc = run.percentiles("total_net", [5, 50, 95], weights=weights)
+            d1, d2 = st.columns(2)
+            draws_format = d1.selectbox("Draws format", export_formats(), format_func=EXPORT_LABELS.get, key="mc_draws_format")
+            draws_float32 = d2.checkbox("float32 values", value=False, key="mc_draws_float32", disabled=draws_format == "csv")
+            export_download("Download mc_draws", "mc_draws", partial(export_run, run, None, draws_format, draws_float32), draws_format, "download_mc_draws")
+        # Both paths bin on the server; the chart size does not depend on the iteration count
+        with PROFILER.stage("figures.sensitivity"):
+            fig = binned_histogram(
+                edges, counts, "Monte Carlo distribution of total net €", "total_net",
+                quantiles={"P5": perc[0], "P50": perc[1], "P95": perc[2]},
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        c1, c2, c3 = st.columns(3)
+        c1.metric("5th %", euro(perc[0]))
+        c2.metric("Median", euro(perc[1]))
+        c3.metric("95th %", euro(perc[2]))
+        st.caption("Scenario: {}".format("Retail only" if not include_rail else "Rail + Retail combined"))
+
+    st.markdown("### What drives total net €")
+    if st.checkbox("Run global sensitivity analysis (Sobol + Morris)", value=False, key="mc_gsa"):
+        sobol = MODEL_CACHE.call(
+            sobol_indices,
+            st.session_state.rail_inputs,
+            st.session_state.retail_inputs,
+            st.session_state.months,
+            seed=123
         )
-        include_rail = scenario == "Combined (rail + retail)"
-        include_retail = True
-
-        if include_rail and st.session_state.rail_inputs is None:
-            st.warning("Please configure the Rail tab first to include rail in Monte Carlo.")
-            return
-        if include_retail and st.session_state.retail_inputs is None:
-            st.warning("Please configure the Retail tab first to include retail in Monte Carlo.")
-            return
-        results = run_monte_carlo(
+        with PROFILER.stage("figures.sensitivity"):
+            import plotly.express as px
+
+            indices = sobol.melt(id_vars="label", value_vars=["S1", "ST"], var_name="index", value_name="share of variance")
+            fig_sobol = px.bar(
+                indices, x="share of variance", y="label", color="index", barmode="group", orientation="h",
+                title="Sobol indices (S1 first-order, ST total)",
+            )
+            st.plotly_chart(fig_sobol, use_container_width=True)
+
+        morris = MODEL_CACHE.call(
+            morris_effects,
             st.session_state.rail_inputs,
             st.session_state.retail_inputs,
             st.session_state.months,
-            include_rail=include_rail,
-            include_retail=include_retail,
-            iterations=2000,
             seed=123
         )
-        fig = px.histogram(results, x="total_net", nbins=60, title="Monte Carlo distribution of total net €")
+        st.dataframe(
+            morris[["label", "mu_star", "sigma"]].rename(columns={"label": "factor", "mu_star": "μ* (€ per unit range)", "sigma": "σ"}),
+            use_container_width=True, hide_index=True,
+        )
+        st.caption("Opt-ins vary ±50%, shares ±10 pts, charm prevalence 60–90%, fees 0–3% and €0–0.20. "
+                   "Seasonality only moves net € between months, so it is not a factor.")
+
+
+def ab_tab() -> None:
+    st.subheader("A/B Lab")
+    st.caption("Plan opt-in experiments on the donation prompt: sample size per variant and test duration at the traffic of the current scenario.")
+    initiative = st.radio("Traffic", ["Rail (digital ticket purchases)", "Retail (checkout transactions)"], horizontal=True, key="ab_initiative")
+    if initiative.startswith("Rail"):
+        daily = rail_daily_traffic(st.session_state.rail_inputs)
+        default_baseline = st.session_state.rail_inputs.optin_web_1
+    else:
+        daily = retail_daily_traffic(st.session_state.retail_inputs)
+        default_baseline = st.session_state.retail_inputs.optin
+
+    c1, c2 = st.columns(2)
+    baseline = c1.number_input("Baseline opt-in %", min_value=0.1, max_value=50.0, value=max(0.1, round(default_baseline * 100, 2)), step=0.1, key="ab_baseline") / 100.0
+    lift = c1.slider("Minimum detectable lift (relative %)", 1, 100, 10, key="ab_lift") / 100.0
+    variants = c1.slider("Variants (incl. control)", 2, 4, 2, key="ab_variants")
+    power = c2.slider("Power", 0.50, 0.99, 0.80, 0.01, key="ab_power")
+    alpha = c2.select_slider("Alpha", options=[0.01, 0.05, 0.10], value=0.05, key="ab_alpha")
+    traffic_share = c2.slider("% of traffic in the test", 1, 100, 100, key="ab_traffic_share") / 100.0
+
+    plan = plan_tests(baseline, baseline * (1 + lift), daily, alpha, power, variants, traffic_share).iloc[0]
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Sample size per variant", f"{plan['n_per_variant']:,.0f}" if np.isfinite(plan["n_per_variant"]) else "n/a")
+    m2.metric("Total sample", f"{plan['total_n']:,.0f}" if np.isfinite(plan["total_n"]) else "n/a")
+    m3.metric("Days at current traffic", f"{plan['days']:,.0f}" if np.isfinite(plan["days"]) else "n/a")
+    st.caption(f"{daily * traffic_share:,.0f} exposures/day in the test; with {variants} variants alpha is split over {variants - 1} comparison(s) with the control.")
+
+    # 3 x 1,000 design points from one vectorized call
+    lifts = np.linspace(0.01, 1.0, 1000)
+    curve = MODEL_CACHE.call(
+        plan_tests, baseline, baseline * (1 + lifts)[:, None], daily, alpha, np.array([0.7, 0.8, 0.9]), variants, traffic_share,
+    )
+    with PROFILER.stage("figures.ab"):
+        import plotly.express as px
+
+        fig = px.line(
+            curve.assign(power=curve["power"].map("{:.0%}".format)), x="lift", y="days", color="power", log_y=True,
+            labels={"lift": "relative lift", "days": "days to complete"}, title="Test duration by detectable lift",
+        )
+        fig.add_vline(x=lift, line_dash="dash")
+        fig.update_xaxes(tickformat=".0%")
         st.plotly_chart(fig, use_container_width=True)
-        perc = np.percentile(results["total_net"], [5, 50, 95])
-        c1, c2, c3 = st.columns(3)
-        c1.metric("5th %", euro(perc[0]))
-        c2.metric("Median", euro(perc[1]))
-        c3.metric("95th %", euro(perc[2]))
-        st.caption("Scenario: {}".format("Retail only" if not include_rail else "Rail + Retail combined"))
+
+
+def load_assumptions(a: Dict[str, Any]) -> None:
+    # Make a stored scenario the working one; input widgets restart from its values
+    st.session_state.assumptions = json.loads(json.dumps(a))
+    for key in [k for k in st.session_state if k.startswith(("rail_", "retail_", "assump_", "assumptions_"))]:
+        del st.session_state[key]
+    st.session_state.rail_inputs = rail_inputs_from_assumptions(st.session_state.assumptions)
+    st.session_state.retail_inputs = retail_inputs_from_assumptions(st.session_state.assumptions)
+
+
+def library_tab() -> None:
+    st.subheader("Scenario library")
+    st.caption(f"Saved assumption sets (the inputs.json content) in {SCENARIO_LIBRARY.path}.")
+
+    with st.expander("Save or import", expanded=len(SCENARIO_LIBRARY) == 0):
+        c1, c2 = st.columns(2)
+        name = c1.text_input("Name", key="library_name")
+        tags = parse_tags(c2.text_input("Tags (comma separated)", key="library_tags"))
+        current = scenario_hash(st.session_state.assumptions)
+        same = SCENARIO_LIBRARY.search(input_hash=current)
+        if len(same):
+            st.caption(f"The current assumptions are already saved as: {', '.join(same['name'])}")
+        if st.button("Save current assumptions", key="save_scenario", disabled=not name.strip()):
+            SCENARIO_LIBRARY.save(name, st.session_state.assumptions, tags)
+            st.success(f"Saved '{name.strip()}'")
+        files = st.file_uploader("Import inputs.json files", type="json", accept_multiple_files=True, key="upload_scenarios")
+        if files and st.button(f"Import {len(files)} file(s) with these tags", key="import_scenarios"):
+            # File stems become names; an existing name is overwritten
+            SCENARIO_LIBRARY.save_many((f.name.rsplit(".", 1)[0], json.load(f), tags) for f in files)
+            st.success(f"Imported {len(files)} scenario(s)")
+
+    c1, c2 = st.columns(2)
+    text = c1.text_input("Search names", key="library_search")
+    tag_filter = c2.multiselect("With all tags", SCENARIO_LIBRARY.tags(), key="library_tag_filter")
+    found = SCENARIO_LIBRARY.search(text, tag_filter)
+    if found.empty:
+        st.info("No saved scenarios match.")
+        return
+    st.dataframe(found, use_container_width=True, hide_index=True)
+
+    if st.checkbox(f"Compare all {len(found)} matches", key="library_all"):
+        selected = found["name"].tolist()
     else:
-        st.info("Use Monte Carlo toggle to explore uncertainty bands.")
+        selected = st.multiselect("Scenarios to compare", found["name"].tolist(), key="library_selected")
+    if not selected:
+        return
+
+    months = st.session_state.months
+    scenarios = SCENARIO_LIBRARY.load(selected)
+    # One batched model pass for the whole selection
+    table = MODEL_CACHE.call(compare_scenarios, scenarios, months=months)
+    st.markdown(f"#### Comparison ({months} month{'s' if months != 1 else ''})")
+    st.dataframe(
+        table.style.format({"rail_net": euro, "retail_net": euro, "total_net": euro, "share_of_msf_2024": pct}),
+        use_container_width=True, hide_index=True,
+    )
+    with PROFILER.stage("figures.library"):
+        import plotly.express as px
+
+        long = table.melt(id_vars="scenario", value_vars=["rail_net", "retail_net"], var_name="initiative", value_name="net")
+        fig = px.bar(long, x="scenario", y="net", color="initiative", title="Net € by scenario", labels={"net": "net €"})
+        st.plotly_chart(fig, use_container_width=True)
+    st.download_button(
+        "Download comparison.csv", data=table.to_csv(index=False).encode("utf-8"),
+        file_name="scenario_comparison.csv", mime="text/csv", key="download_comparison",
+    )
+
+    c1, c2 = st.columns(2)
+    if len(selected) == 1 and c1.button(f"Load '{selected[0]}' as working scenario", key="load_scenario"):
+        load_assumptions(scenarios[selected[0]])
+        st.rerun()
+    if c2.button(f"Delete {len(selected)} selected", key="delete_scenarios"):
+        SCENARIO_LIBRARY.delete(selected)
+        st.session_state.pop("library_selected", None)
+        st.rerun()
+
+
+def unit_table_input(kind: str, label: str):
+    # A parsed upload stays in the session, so other tabs and reruns do not re-read the file
+    state = f"units_{kind}"
+    file = st.file_uploader(label, type=["csv", "parquet"], key=f"upload_{kind}_units")
+    if file is not None and st.session_state.get(f"{state}_file") != file.file_id:
+        try:
+            st.session_state[state] = load_units(file, kind, file.name)
+            st.session_state[f"{state}_file"] = file.file_id
+            st.session_state.pop(f"partners_{kind}_by", None)
+        except (ValueError, ImportError) as e:
+            st.error(str(e))
+    return st.session_state.get(state)
+
+
+def partners_tab() -> None:
+    st.subheader("Partner data")
+    st.caption(
+        "Per-route rail volumes and per-store receipts from partner files (CSV or Parquet). Empty cells and missing "
+        "optional columns use the current Rail/Retail inputs; other text columns can be used for grouping."
+    )
+    c1, c2 = st.columns(2)
+    with c1:
+        routes = unit_table_input("rail", "Rail routes (operator, riders, optional shares and opt-ins)")
+    with c2:
+        stores = unit_table_input("retail", "Retail stores (daily_receipts, optional stores, active days, rates)")
+    if st.button("Load sample tables (10,000 routes, 20,000 stores)", key="units_sample"):
+        routes = st.session_state.units_rail = units_from_frame(sample_rail_routes(st.session_state.rail_inputs), "rail")
+        stores = st.session_state.units_retail = units_from_frame(sample_retail_stores(st.session_state.retail_inputs), "retail")
+        for key in ("partners_rail_by", "partners_retail_by"):
+            st.session_state.pop(key, None)
+    if routes is None and stores is None:
+        st.info("Upload a route or store table, or load the sample tables to see the expected columns.")
+        return
+
+    months = st.session_state.months
+    rail_inputs, retail_inputs = st.session_state.rail_inputs, st.session_state.retail_inputs
+    c1, c2 = st.columns(2)
+    rail_by = retail_by = None
+    if routes is not None:
+        options = list(routes.labels.columns)
+        rail_by = c1.selectbox("Group routes by", options, index=options.index("operator"), key="partners_rail_by")
+    if stores is not None:
+        options = [None] + list(stores.labels.columns)
+        retail_by = c2.selectbox(
+            "Group stores by", options, index=options.index("cluster") if "cluster" in options else 0,
+            format_func=lambda c: "all stores" if c is None else c, key="partners_retail_by",
+        )
+
+    # One vectorized pass over all units per initiative, then group-by sums
+    forecasts, groups = {}, []
+    if routes is not None:
+        forecasts["rail_units"] = rail_unit_forecast(routes, rail_inputs, months)
+        groups.append(aggregate_units(forecasts["rail_units"], rail_by).rename(columns={rail_by: "group"}).assign(initiative="rail"))
+    if stores is not None:
+        forecasts["retail_units"] = retail_unit_forecast(stores, retail_inputs, months)
+        groups.append(aggregate_units(forecasts["retail_units"], retail_by).rename(columns={retail_by: "group"}).assign(initiative="retail"))
+
+    c1, c2, c3 = st.columns(3)
+    rail_net = groups[0]["net"].sum() if routes is not None else 0.0
+    retail_net = groups[-1]["net"].sum() if stores is not None else 0.0
+    c1.metric(f"Partner net € ({months} month{'s' if months != 1 else ''})", euro(rail_net + retail_net))
+    c2.metric(f"Rail net € ({len(routes) if routes is not None else 0:,} routes)", euro(rail_net))
+    c3.metric(f"Retail net € ({len(stores) if stores is not None else 0:,} stores)", euro(retail_net))
+
+    for table in groups:
+        st.markdown(f"#### {table['initiative'].iloc[0].capitalize()} by group")
+        shown = table.drop(columns="initiative")
+        st.dataframe(
+            shown.style.format({c: (euro if c in ("gross", "net", "net_online", "net_in_store") else "{:,.0f}") for c in shown.columns if c != "group"}),
+            use_container_width=True, hide_index=True,
+        )
+    with PROFILER.stage("figures.partners"):
+        import plotly.express as px
+
+        fig = px.bar(pd.concat(groups), x="group", y="net", color="initiative", title="Net € by partner group", labels={"net": "net €"})
+        st.plotly_chart(fig, use_container_width=True)
+
+    fmt = st.radio("Unit forecast format", export_formats(), format_func=EXPORT_LABELS.get, key="partners_format", horizontal=True)
+    for stem, forecast in forecasts.items():
+        export_download(f"Download {stem}", stem, partial(export_frame, forecast, fmt, False), fmt, f"download_{stem}")
+
+    st.markdown("#### Monte Carlo by group")
+    st.caption("Opt-ins, digital share, charm prevalence and seasonality are drawn as on the Sensitivity tab and move every unit's own value by the same ratio.")
+    if st.checkbox("Run Monte Carlo", value=False, key="partners_mc"):
+        c1, c2 = st.columns(2)
+        iterations = c1.select_slider("Iterations", options=[2_000, 10_000, 100_000], value=10_000, key="partners_mc_iterations")
+        sampling = c2.selectbox("Sampling", list(SAMPLING_LABELS), format_func=SAMPLING_LABELS.get, key="partners_mc_sampling")
+        draws = unit_monte_carlo(
+            routes, stores, rail_inputs, retail_inputs, months, rail_by, retail_by,
+            iterations=iterations, seed=123, sampling=sampling,
+        )
+        with PROFILER.stage("dataframe.partners_bands"):
+            bands = draws.quantile([0.05, 0.5, 0.95]).T
+            bands.columns = ["5th %", "Median", "95th %"]
+        st.dataframe(bands.style.format(euro), use_container_width=True)
 
 
 def assumptions_tab() -> None:
     st.subheader("Assumptions (editable)")
     if st.button("Reset to source defaults"):
         st.session_state.assumptions = json.loads(json.dumps(DEFAULTS))
+        # Drop persisted widget values so the widgets pick up the restored defaults
+        for key in [k for k in st.session_state if k.startswith(("assump_", "assumptions_"))]:
+            del st.session_state[key]
         st.rerun()
 
     a = st.session_state.assumptions
@@ -373,6 +835,11 @@ def assumptions_tab() -> None:
     cols = st.columns(6)
     for i in range(12):
         a["rail"]["seasonality"][i] = cols[i % 6].number_input(f"m{i+1}", min_value=0.1, max_value=2.0, value=float(a["rail"]["seasonality"][i]), step=0.05, key=f"assump_rail_season_{i}")
+    st.caption("Year-on-year growth % (horizons > 12 months):")
+    cols = st.columns(3)
+    a["rail"]["ridership_growth_pct"] = cols[0].number_input("Ridership", min_value=-50.0, max_value=100.0, value=float(a["rail"].get("ridership_growth_pct", 0)), step=1.0, key="assump_rail_ridership_growth")
+    a["rail"]["digital_share_growth_pct"] = cols[1].number_input("Digital share", min_value=-50.0, max_value=100.0, value=float(a["rail"].get("digital_share_growth_pct", 0)), step=1.0, key="assump_rail_digital_growth")
+    a["rail"]["optin_growth_pct"] = cols[2].number_input("Opt-in", min_value=-50.0, max_value=100.0, value=float(a["rail"].get("optin_growth_pct", 0)), step=1.0, key="assump_rail_optin_growth")
 
     st.markdown("### Retail defaults")
     col1, col2 = st.columns(2)
@@ -389,6 +856,8 @@ def assumptions_tab() -> None:
         a["retail"]["daily_receipts"] = st.number_input("Daily receipts (per store)", min_value=0, value=int(a["retail"]["daily_receipts"]), key="assump_retail_daily_receipts")
         a["retail"]["stores"] = st.number_input("Stores", min_value=0, value=int(a["retail"]["stores"]), key="assump_retail_stores")
         a["retail"]["active_days"] = st.number_input("Active days/year", min_value=1, max_value=366, value=int(a["retail"]["active_days"]), key="assump_retail_active_days")
+        a["retail"]["volume_growth_pct"] = st.number_input("Transaction volume growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["retail"].get("volume_growth_pct", 0)), step=1.0, key="assump_retail_volume_growth")
+        a["retail"]["optin_growth_pct"] = st.number_input("Opt-in growth %/yr", min_value=-50.0, max_value=100.0, value=float(a["retail"].get("optin_growth_pct", 0)), step=1.0, key="assump_retail_optin_growth")
 
     st.markdown("### Fees defaults")
     a["fees"]["processor"] = st.selectbox("Default processor", ["Adyen Giving", "Stripe", "Nexi"], index=["Adyen Giving", "Stripe", "Nexi"].index(a["fees"]["processor"]), key="assumptions_processor")
@@ -398,57 +867,119 @@ def assumptions_tab() -> None:
     st.success("Assumptions updated in-session. Use 'Reset' to restore source defaults.")
 
 
+def export_formats() -> list:
+    # Parquet and Arrow IPC need pyarrow
+    return list(EXPORT_LABELS) if importlib.util.find_spec("pyarrow") is not None else ["csv"]
+
+
+def export_download(label: str, stem: str, build, fmt: str, key: str) -> None:
+    # The file is written only when the button is clicked, on Streamlit's download thread
+    # (callable data needs Streamlit 1.52), so reruns never serialise exports. Streamlit reads
+    # file-like data into bytes and serves downloads from memory, so the finished file is
+    # held whole while it downloads; the writers only bound the memory of building it
+    mime, ext = EXPORT_FORMATS[fmt]
+
+    def data() -> bytes:
+        with PROFILER.stage(f"export.{fmt}"), build() as out:
+            return out.read()
+
+    st.download_button(
+        f"{label}{ext}", data=data, file_name=f"{stem}{ext}", mime=mime, key=key,
+        help="Built when clicked; the finished file is held in memory while it downloads.",
+    )
+
+
 def download_tab(rail_df: pd.DataFrame, retail_df: pd.DataFrame) -> None:
     st.subheader("Download")
 
-    inputs_json = json.dumps(st.session_state.assumptions, indent=2)
+    with PROFILER.stage("export.json"):
+        inputs_json = json.dumps(st.session_state.assumptions, indent=2)
     st.download_button("Download inputs.json", data=inputs_json, file_name="inputs.json", mime="application/json")
 
-    monthly = pd.concat([rail_df.assign(initiative="rail"), retail_df.assign(initiative="retail")], ignore_index=True)
-    csv_monthly = monthly.to_csv(index=False).encode("utf-8")
-    st.download_button("Download monthly_projections.csv", data=csv_monthly, file_name="monthly_projections.csv", mime="text/csv")
-
-    scenarios = monthly.groupby(["initiative", "metric"])  \
-        ["value"].sum().reset_index()
-    csv_scen = scenarios.to_csv(index=False).encode("utf-8")
-    st.download_button("Download scenarios_summary.csv", data=csv_scen, file_name="scenarios_summary.csv", mime="text/csv")
-
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import cm
-
-        if st.button("Generate one-pager PDF"):
-            import io
-            buf = io.BytesIO()
-            c = canvas.Canvas(buf, pagesize=A4)
-            width, height = A4
-            c.setFont("Helvetica-Bold", 14)
-            c.drawString(2*cm, height-2*cm, "MSF Micro-donations Simulator – One-pager")
-
-            rail_annual = rail_df[rail_df["metric"] == "net"]["value"].sum()
-            retail_annual = retail_df[(retail_df["metric"] == "net") & (retail_df["channel"] == "all")]["value"].sum()
-            total = rail_annual + retail_annual
-            c.setFont("Helvetica", 11)
-            c.drawString(2*cm, height-3*cm, f"Rail net €: {euro(rail_annual)}")
-            c.drawString(2*cm, height-3.7*cm, f"Retail net €: {euro(retail_annual)}")
-            c.drawString(2*cm, height-4.4*cm, f"Total net €: {euro(total)}")
-            c.drawString(2*cm, height-5.4*cm, "Assumptions snapshot: see inputs.json")
-            c.showPage()
-            c.save()
-            st.download_button("Download one-pager.pdf", data=buf.getvalue(), file_name="one_pager.pdf", mime="application/pdf")
-    except Exception:
+    c1, c2, c3 = st.columns(3)
+    fmt = c1.radio("Format", export_formats(), format_func=EXPORT_LABELS.get, key="export_format", horizontal=True)
+    layout = c2.radio(
+        "Layout", ["long", "wide"], format_func=str.capitalize, key="export_layout", horizontal=True,
+        help="Wide: one row per month and one column per initiative/operator/channel/metric series.",
+    )
+    float32 = c3.checkbox("float32 values", value=False, key="export_float32", disabled=fmt == "csv", help="Halves the numeric columns (about 7 significant digits).")
+
+    monthly = combine_projections(rail_df, retail_df)
+    projections = wide_projections(monthly) if layout == "wide" else monthly
+    export_download("Download monthly_projections", "monthly_projections", partial(export_frame, projections, fmt, float32), fmt, "download_monthly")
+    scenarios = summarize_projections(monthly)
+    export_download("Download scenarios_summary", "scenarios_summary", partial(export_frame, scenarios, fmt, float32), fmt, "download_summary")
+
+    if importlib.util.find_spec("reportlab") is None:
         st.warning("PDF engine not available. Use chart toolbar to download PNGs and combine with CSV exports.")
+        return
+    st.markdown("#### PDF report")
+    args = (
+        st.session_state.rail_inputs, st.session_state.retail_inputs, st.session_state.months,
+        st.session_state.assumptions["msf_italy"]["fundraising_2024_eur"],
+    )
+    key = report_key(*args)
+    job = REPORT_JOBS.get(key)
+    pdf = cached_report(key)
+    if pdf is None and job is not None and job.done() and job.exception() is None:
+        pdf = job.result()
+    if pdf is not None:
+        st.download_button("Download msf_report.pdf", data=pdf, file_name="msf_report.pdf", mime="application/pdf", key="report_download")
+    elif job is None or job.done():
+        if job is not None:
+            st.warning(f"Report failed: {job.exception()}")
+        # Key outside the persisted prefixes: buttons cannot be set through session state
+        if st.button("Generate PDF report", key="report_generate"):
+            REPORT_JOBS.submit(key, build_report, *args)
+            report_progress(key)
+    else:
+        report_progress(key)
+    st.caption("Overview, rail and retail funnels, monthly seasonality, channels, Monte Carlo bands and the assumptions. "
+               "Reports are built in the background and cached per scenario.")
 
 
-def main() -> None:
-    init_state()
+@st.fragment(run_every=1.0)
+def report_progress(key: str) -> None:
+    # Polls the background build; only this fragment reruns until the report is ready
+    job = REPORT_JOBS.get(key)
+    if job is None or job.done():
+        st.rerun()
+    st.info("Rendering the report in the background; you can keep using the app.")
+
+
+def cache_stats_sidebar() -> None:
+    stats = MODEL_CACHE.stats()
+    with st.sidebar.expander("Model cache"):
+        st.caption(f"{stats['size']} / {stats['maxsize']} entries")
+        if stats["functions"]:
+            st.dataframe(pd.DataFrame(stats["functions"]).T, use_container_width=True)
+        if st.button("Clear cache", key="cache_clear"):
+            MODEL_CACHE.clear()
+            st.rerun()
+        store = MC_STORE.stats()
+        st.caption(f"Monte Carlo store: {store['runs']} run(s), {store['bytes'] / 1e6:,.0f} / {store['max_bytes'] / 1e6:,.0f} MB")
+        if st.button("Clear Monte Carlo store", key="mcstore_clear"):
+            MC_STORE.clear()
+            st.rerun()
+
+
+TAB_NAMES = ["Overview", "Rail", "Retail", "Sensitivity", "A/B Lab", "Library", "Partners", "Assumptions", "Sources", "Download"]
 
-    tabs = st.tabs(["Overview", "Rail", "Retail", "Sensitivity", "Assumptions", "Sources", "Download"])
+
+def shared_results() -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Base scenario from the last inputs the Rail/Retail tabs produced (or the defaults)
+    months = st.session_state.months
+    rail_df = MODEL_CACHE.call(compute_rail_monthly, st.session_state.rail_inputs, months=months)
+    retail_df = MODEL_CACHE.call(compute_retail_monthly, st.session_state.retail_inputs, months=months)
+    return rail_df, retail_df
+
+
+def render_all_tabs() -> None:
+    tabs = st.tabs(TAB_NAMES)
 
     # Compute base scenario for Overview
     with tabs[1]:
-        rail_df = rail_tab()
+        rail_df = rail_tab().to_frame()
     with tabs[2]:
         retail_df = retail_tab()
     with tabs[0]:
@@ -456,13 +987,94 @@ def main() -> None:
     with tabs[3]:
         sensitivity_tab(rail_df, retail_df)
     with tabs[4]:
-        assumptions_tab()
+        ab_tab()
     with tabs[5]:
-        sources_tab()
+        library_tab()
     with tabs[6]:
+        partners_tab()
+    with tabs[7]:
+        assumptions_tab()
+    with tabs[8]:
+        sources_tab()
+    with tabs[9]:
         download_tab(rail_df, retail_df)
 
 
+def render_active_tab() -> None:
+    # Only the selected view builds its figures and export payloads
+    active = st.radio("View", TAB_NAMES, horizontal=True, key="active_tab", label_visibility="collapsed")
+    if active == "Overview":
+        overview_tab(*shared_results())
+    elif active == "Rail":
+        rail_tab()
+    elif active == "Retail":
+        retail_tab()
+    elif active == "Sensitivity":
+        sensitivity_tab(*shared_results())
+    elif active == "A/B Lab":
+        ab_tab()
+    elif active == "Library":
+        library_tab()
+    elif active == "Partners":
+        partners_tab()
+    elif active == "Assumptions":
+        assumptions_tab()
+    elif active == "Sources":
+        sources_tab()
+    elif active == "Download":
+        download_tab(*shared_results())
+
+
+def perf_debug_sidebar() -> None:
+    if not st.sidebar.toggle("Performance debug panel", value=PROFILER.enabled, key="perf_debug"):
+        if PROFILER.enabled:
+            PROFILER.disable()
+        return
+    track_memory = st.sidebar.checkbox("Track allocations (slower)", value=PROFILER.track_memory, key="perf_track_memory")
+    if not PROFILER.enabled or PROFILER.track_memory != track_memory:
+        PROFILER.enable(track_memory=track_memory)
+
+
+def perf_debug_panel() -> None:
+    if not PROFILER.enabled:
+        return
+    with st.sidebar.expander("Performance (all sessions)", expanded=True):
+        stats = PROFILER.stats()
+        if stats:
+            table = pd.DataFrame(stats).T.sort_values("total_s", ascending=False)
+            st.dataframe(table[["calls", "total_s", "mean_s", "max_s", "alloc_peak_mb"]], use_container_width=True)
+        st.download_button(
+            "Export stats (JSON)", data=PROFILER.to_json(cache=MODEL_CACHE.stats()),
+            file_name="perf_stats.json", mime="application/json", key="perf_export_json",
+        )
+        st.download_button(
+            "Export trace (Chrome/Perfetto)", data=PROFILER.to_chrome_trace(),
+            file_name="perf_trace.json", mime="application/json", key="perf_export_trace",
+        )
+        if st.button("Reset stats", key="perf_reset"):
+            PROFILER.reset()
+            st.rerun()
+
+
+def main() -> None:
+    init_state()
+    persist_widget_state()
+    perf_debug_sidebar()
+
+    with PROFILER.stage("rerun"):
+        lazy = st.sidebar.toggle(
+            "Render active tab only", value=True, key="lazy_tabs",
+            help="Skip building charts and exports for tabs that are not visible.",
+        )
+        if lazy:
+            render_active_tab()
+        else:
+            render_all_tabs()
+
+    cache_stats_sidebar()
+    perf_debug_panel()
+
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,136 @@
+"""Headless batch runner for scenario files exported by the Download tab.
+
+Usage:
+    python batch.py scenarios/ extra.json --out results --months 12 --mc 2000 --workers 4
+    python batch.py scenarios/ --months 36 --format parquet --float32 --wide
+
+Every scenario gets its own folder with monthly_projections and
+scenarios_summary files (same layouts and formats as the app exports);
+summary.csv collects one row per scenario. No Streamlit import anywhere on this path.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.montecarlo import run_monte_carlo
+from models.rail import compute_rail_monthly
+from models.retail import compute_retail_monthly
+from models.scenario import (
+    combine_projections, load_scenario, rail_inputs_from_assumptions, retail_inputs_from_assumptions,
+    scenario_paths, summarize_projections,
+)
+from utils.export import EXPORT_FORMATS, frame_blocks, label_categories, wide_projections, write_frames
+
+
+def _write(frame: pd.DataFrame, path: Path, fmt: str, float32: bool) -> None:
+    with open(path, "wb") as out:
+        write_frames(frame_blocks(frame), out, fmt, float32, label_categories(frame))
+
+
+def run_scenario(
+    path: Path, out_dir: Path, months: int = 12, mc_iterations: int = 0, seed: Optional[int] = None,
+    fmt: str = "csv", float32: bool = False, wide: bool = False,
+) -> Dict[str, Any]:
+    a = load_scenario(path)
+    rail_inputs = rail_inputs_from_assumptions(a)
+    retail_inputs = retail_inputs_from_assumptions(a)
+
+    monthly = combine_projections(
+        compute_rail_monthly(rail_inputs, months=months),
+        compute_retail_monthly(retail_inputs, months=months),
+    )
+    summary = summarize_projections(monthly)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ext = EXPORT_FORMATS[fmt][1]
+    _write(wide_projections(monthly) if wide else monthly, out_dir / f"monthly_projections{ext}", fmt, float32)
+    _write(summary, out_dir / f"scenarios_summary{ext}", fmt, float32)
+
+    # Totals follow the Overview tab
+    rail_net = monthly.loc[
+        (monthly["initiative"] == "rail") & (monthly["metric"] == "net") & (monthly["operator"] == "all"), "value"
+    ].sum()
+    retail_net = monthly.loc[
+        (monthly["initiative"] == "retail") & (monthly["metric"] == "net") & (monthly["channel"] == "all"), "value"
+    ].sum()
+    row = {
+        "scenario": path.stem,
+        "path": str(path),
+        "months": months,
+        "rail_net": rail_net,
+        "retail_net": retail_net,
+        "total_net": rail_net + retail_net,
+        "share_of_msf_2024": (rail_net + retail_net) / a["msf_italy"]["fundraising_2024_eur"] if a["msf_italy"]["fundraising_2024_eur"] > 0 else 0.0,
+    }
+    if mc_iterations > 0:
+        results = run_monte_carlo(rail_inputs, retail_inputs, months, iterations=mc_iterations, seed=seed)
+        p5, p50, p95 = np.percentile(results["total_net"], [5, 50, 95])
+        row.update({"mc_p5": p5, "mc_p50": p50, "mc_p95": p95})
+    return row
+
+
+def _run_job(job: tuple) -> Dict[str, Any]:
+    path, out_dir, months, mc_iterations, seed, fmt, float32, wide = job
+    try:
+        return run_scenario(path, out_dir, months, mc_iterations, seed, fmt, float32, wide)
+    except Exception as exc:
+        # One bad file should not sink a nightly sweep of thousands
+        return {"scenario": path.stem, "path": str(path), "error": f"{type(exc).__name__}: {exc}"}
+
+
+def run_batch(
+    paths, out: Path, months: int = 12, mc_iterations: int = 0, seed: Optional[int] = None, workers: Optional[int] = None,
+    fmt: str = "csv", float32: bool = False, wide: bool = False,
+) -> pd.DataFrame:
+    files = scenario_paths(paths)
+    jobs = []
+    used = set()
+    for path in files:
+        # Keep output folders unique when stems repeat across directories
+        name = path.stem
+        suffix = 2
+        while name in used:
+            name = f"{path.stem}_{suffix}"
+            suffix += 1
+        used.add(name)
+        jobs.append((path, out / name, months, mc_iterations, seed, fmt, float32, wide))
+
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if workers <= 1:
+        rows = [_run_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(_run_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    summary = pd.DataFrame(rows)
+    out.mkdir(parents=True, exist_ok=True)
+    summary.to_csv(out / "summary.csv", index=False)
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Evaluate inputs.json scenario files without the Streamlit UI.")
+    parser.add_argument("paths", nargs="+", help="Scenario files or directories of *.json files")
+    parser.add_argument("--out", default="batch_output", help="Output directory (default: batch_output)")
+    parser.add_argument("--months", type=int, default=12, help="Projection horizon in months (default: 12)")
+    parser.add_argument("--mc", type=int, default=0, metavar="ITERATIONS", help="Monte Carlo iterations per scenario (default: off)")
+    parser.add_argument("--seed", type=int, default=None, help="Monte Carlo seed")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv", help="Per-scenario file format (default: csv)")
+    parser.add_argument("--float32", action="store_true", help="Write values as float32 (parquet/arrow)")
+    parser.add_argument("--wide", action="store_true", help="One row per month and one column per series in monthly_projections")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.paths, Path(args.out), args.months, args.mc, args.seed, args.workers, args.format, args.float32, args.wide)
+    failed = summary["error"].notna().sum() if "error" in summary else 0
+    print(f"{len(summary) - failed} scenario(s) written to {args.out}, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
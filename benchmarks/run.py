@@ -0,0 +1,307 @@
+"""Benchmarks for the model hot paths.
+
+Usage:
+    python -m benchmarks.run                 # full sizes, append to history, check regressions
+    python -m benchmarks.run --quick         # smaller sizes for a fast local check
+    python -m benchmarks.run -k mc --no-save # only cases whose name contains "mc"
+
+Each case reports throughput (items/s, best of --repeat runs) and peak traced
+memory. Results are appended to benchmarks/history.jsonl and compared with the
+previous run of the same case on the same machine; the exit code is 1 when
+throughput drops or peak memory grows by more than --threshold.
+
+The cold_start case imports app.py and renders the default view in a fresh
+interpreter; it also fails when that takes longer than --cold-start-budget
+seconds or loads a dependency that should wait for its feature (DEFERRED_MODULES).
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from defaults import DEFAULTS
+from models.ab import plan_tests, sample_size_two_proportions
+from models.goalseek import ASK_TYPES, goal_seek, goal_seek_probability
+from models.microsim import simulate_retail_transactions
+from models.moments import moment_bands
+from models.montecarlo import run_monte_carlo
+from models.rail import compute_rail_monthly
+from models.retail import compute_retail_grid, compute_retail_monthly, simulate_roundup_distribution
+from models.scenario import compare_scenarios, rail_inputs_from_assumptions, retail_inputs_from_assumptions
+from models.units import (
+    rail_unit_forecast, retail_unit_forecast, sample_rail_routes, sample_retail_stores, unit_monte_carlo, units_from_frame,
+)
+from utils.export import export_frame
+
+
+HISTORY = Path(__file__).with_name("history.jsonl")
+ROOT = Path(__file__).resolve().parents[1]
+
+# Heavy dependencies that must not load before the feature using them:
+# on import of app.py, and (except plotting, needed by the Overview chart) on first render
+DEFERRED_MODULES = ("scipy.stats", "statsmodels", "reportlab", "qrcode", "plotly.express")
+FIRST_RENDER_MODULES = ("plotly.express",)
+
+COLD_START_SCRIPT = """
+import json, sys, time
+deferred = {deferred!r}
+start = time.perf_counter()
+import app
+import_s = time.perf_counter() - start
+loaded_on_import = [m for m in deferred if m in sys.modules]
+
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+start = time.perf_counter()
+at.run()
+render_s = time.perf_counter() - start
+print(json.dumps({{
+    "import_s": import_s,
+    "render_s": render_s,
+    "loaded_on_import": loaded_on_import,
+    "loaded_on_render": [m for m in deferred if m in sys.modules and m not in {allowed!r}],
+    "errors": [e.message for e in at.exception],
+}}))
+"""
+
+
+@dataclass
+class Case:
+    name: str
+    items: int
+    unit: str
+    fn: Callable[[], object]
+
+
+def build_cases(quick: bool = False) -> List[Case]:
+    # Inputs that take a while to build (Monte Carlo draws, partner tables) are cached
+    # helpers called from the case functions, so cases filtered out with -k never build them
+    rail = rail_inputs_from_assumptions(DEFAULTS)
+    retail = retail_inputs_from_assumptions(DEFAULTS)
+    grid_size = 10_000 if quick else 100_000
+    rng = np.random.default_rng(0)
+    grid = {
+        "optin": rng.uniform(0.01, 0.12, grid_size),
+        "charm_prevalence": rng.uniform(0.6, 0.9, grid_size),
+        "avg_receipt": rng.uniform(15.0, 40.0, grid_size),
+    }
+    proportions = rng.uniform(0.01, 0.10, (100, 2))
+
+    cases = []
+    for months in (12, 36):
+        cases.append(Case(f"rail_monthly_{months}m", months, "months", lambda m=months: compute_rail_monthly(rail, months=m)))
+        cases.append(Case(f"retail_monthly_{months}m", months, "months", lambda m=months: compute_retail_monthly(retail, months=m)))
+    cases.append(Case(f"retail_grid_{grid_size}", grid_size, "scenarios", lambda: compute_retail_grid(retail, 12, **grid)))
+    n_samples = 1_000_000 if quick else 10_000_000
+    cases.append(Case(f"roundup_samples_{n_samples}", n_samples, "samples", lambda: simulate_roundup_distribution(retail, n=n_samples, seed=1)))
+    # Items are transactions simulated; peak memory should not move with the horizon
+    for months in ((12,) if quick else (12, 36)):
+        tx = int(compute_retail_monthly(retail, months=months).query("metric == 'transactions'")["value"].sum())
+        cases.append(Case(f"retail_microsim_{months}m", tx, "transactions", lambda m=months: simulate_retail_transactions(retail, months=m, seed=1)))
+    for iterations in ((2_000, 100_000) if quick else (2_000, 100_000, 1_000_000)):
+        cases.append(Case(
+            f"mc_{iterations}", iterations, "iterations",
+            lambda n=iterations: run_monte_carlo(rail, retail, 12, iterations=n, seed=1),
+        ))
+    # Scrambled Sobol with control variates: bands of ~10x as many pseudo-random iterations
+    cases.append(Case(
+        "mc_sobol_cv_2048", 2048, "iterations",
+        lambda: run_monte_carlo(rail, retail, 12, iterations=2048, seed=1, sampling="sobol", control_variates=True),
+    ))
+    cases.append(Case("moment_bands", 1, "scenarios", lambda: moment_bands(rail, retail, 12)))
+    # Streamed columnar export of Monte Carlo output; peak memory should stay near one row group
+    export_rows = 100_000 if quick else 1_000_000
+
+    @cache
+    def draws():
+        return run_monte_carlo(rail, retail, 12, iterations=export_rows, seed=1)
+
+    cases.append(Case(f"export_parquet_{export_rows}", export_rows, "rows", lambda: export_frame(draws(), "parquet").close()))
+    cases.append(Case(
+        "ab_sample_size_100", len(proportions), "designs",
+        lambda: [sample_size_two_proportions(p1, p2) for p1, p2 in proportions],
+    ))
+    design_grid = rng.uniform(0.01, 0.10, (grid_size, 2))
+    cases.append(Case(
+        f"ab_plan_{grid_size}", grid_size, "designs",
+        lambda: plan_tests(design_grid[:, 0], design_grid[:, 1], 1e6, power=0.8),
+    ))
+    target = 0.5 * DEFAULTS["msf_italy"]["fundraising_2024_eur"]
+    asks = {"sweep": "rail.ask_type", "sweep_values": ASK_TYPES}
+    cases.append(Case("goal_seek_asks", len(ASK_TYPES), "solves", lambda: goal_seek(rail, retail, 12, target, "rail.optin_web_1", **asks)))
+    cases.append(Case(
+        "goal_seek_p80_asks", len(ASK_TYPES), "solves",
+        lambda: goal_seek_probability(rail, retail, 12, target, "rail.optin_web_1", 0.8, **asks),
+    ))
+    # Library comparison: assumptions dicts to table, one batched pass
+    library = {}
+    for i in range(100):
+        a = json.loads(json.dumps(DEFAULTS))
+        a["rail"]["ask_type"] = ("€1 fixed", "€2 fixed", "€1 or €2 choice")[i % 3]
+        a["retail"]["optin_pct"] = 1 + i % 20
+        library[f"scenario_{i}"] = a
+    cases.append(Case(f"scenario_compare_{len(library)}", len(library), "scenarios", lambda: compare_scenarios(library, 12)))
+    # Partner tables at chain scale: the Monte Carlo cost should follow iterations x groups, not units
+    n_routes, n_stores = 10_000, 20_000
+
+    @cache
+    def units():
+        return units_from_frame(sample_rail_routes(rail, n_routes), "rail"), units_from_frame(sample_retail_stores(retail, n_stores), "retail")
+
+    cases.append(Case(
+        f"units_forecast_{n_routes + n_stores}", n_routes + n_stores, "units",
+        lambda: (rail_unit_forecast(units()[0], rail, 36), retail_unit_forecast(units()[1], retail, 36)),
+    ))
+    for iterations in ((10_000,) if quick else (10_000, 100_000)):
+        cases.append(Case(
+            f"units_mc_{iterations}", iterations, "iterations",
+            lambda n=iterations: unit_monte_carlo(*units(), rail, retail, 36, "region", "region", iterations=n, seed=1),
+        ))
+    return cases
+
+
+def measure(case: Case, repeat: int) -> Dict[str, float]:
+    case.fn()  # warm-up (imports, caches)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.fn()
+        best = min(best, time.perf_counter() - start)
+
+    # Separate run so tracing overhead does not skew the timing
+    tracemalloc.start()
+    case.fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": best,
+        "throughput": case.items / best if best > 0 else float("inf"),
+        "peak_mb": peak / 1e6,
+    }
+
+
+def cold_start(repeat: int) -> Dict[str, object]:
+    # Fresh interpreter per run, so nothing is already imported; best run is kept
+    script = COLD_START_SCRIPT.format(deferred=DEFERRED_MODULES, allowed=FIRST_RENDER_MODULES)
+    runs = []
+    for _ in range(max(repeat, 1)):
+        out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["import_s"] + r["render_s"])
+    seconds = best["import_s"] + best["render_s"]
+    return {
+        "seconds": seconds,
+        "throughput": 1.0 / seconds,
+        "peak_mb": 0.0,
+        "import_s": best["import_s"],
+        "render_s": best["render_s"],
+        "loaded_early": sorted(set(best["loaded_on_import"]) | set(best["loaded_on_render"])),
+        "errors": best["errors"],
+    }
+
+
+def cold_start_failures(result: Dict[str, object], budget: float) -> List[str]:
+    found = []
+    if result["seconds"] > budget:
+        found.append(f"cold_start: {result['seconds']:.2f} s exceeds the {budget:.2f} s budget")
+    if result["loaded_early"]:
+        found.append(f"cold_start: deferred modules loaded at start-up: {', '.join(result['loaded_early'])}")
+    if result["errors"]:
+        found.append(f"cold_start: first render raised {result['errors']}")
+    return found
+
+
+def machine_id() -> str:
+    return f"{platform.node()}|{platform.machine()}|{platform.python_version()}"
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_results(machine: str) -> Dict[str, Dict[str, float]]:
+    # Latest recorded result per case for this machine
+    previous: Dict[str, Dict[str, float]] = {}
+    if HISTORY.exists():
+        for line in HISTORY.read_text(encoding="utf-8").splitlines():
+            record = json.loads(line)
+            if record.get("machine") == machine:
+                previous.update(record["results"])
+    return previous
+
+
+def regressions(results: Dict[str, Dict[str, float]], previous: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    found = []
+    for name, current in results.items():
+        before = previous.get(name)
+        if before is None:
+            continue
+        if current["throughput"] < before["throughput"] * (1.0 - threshold):
+            found.append(f"{name}: throughput {current['throughput']:,.0f}/s vs {before['throughput']:,.0f}/s")
+        # Small absolute growth (< 1 MB) is noise from interpreter internals
+        if current["peak_mb"] > before["peak_mb"] * (1.0 + threshold) and current["peak_mb"] - before["peak_mb"] > 1.0:
+            found.append(f"{name}: peak memory {current['peak_mb']:.1f} MB vs {before['peak_mb']:.1f} MB")
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the model hot paths.")
+    parser.add_argument("--quick", action="store_true", help="Use smaller sizes")
+    parser.add_argument("-k", dest="filter", default="", help="Only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is kept)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the history")
+    parser.add_argument("--cold-start-budget", type=float, default=2.5, help="Max seconds to import app.py and render the default view (default: 2.5)")
+    args = parser.parse_args(argv)
+
+    machine = machine_id()
+    results = {}
+    for case in build_cases(args.quick):
+        if args.filter not in case.name:
+            continue
+        results[case.name] = measure(case, args.repeat)
+        r = results[case.name]
+        print(f"{case.name:<28} {r['seconds'] * 1e3:>10.2f} ms {r['throughput']:>16,.0f} {case.unit}/s {r['peak_mb']:>9.1f} MB")
+
+    failures = []
+    if args.filter in "cold_start":
+        r = results["cold_start"] = cold_start(args.repeat)
+        print(f"{'cold_start':<28} {r['seconds'] * 1e3:>10.2f} ms (import {r['import_s'] * 1e3:.0f} ms, first render {r['render_s'] * 1e3:.0f} ms)")
+        failures = cold_start_failures(r, args.cold_start_budget)
+
+    found = regressions(results, last_results(machine), args.threshold)
+    if not args.no_save:
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "machine": machine,
+            "quick": args.quick,
+            "results": results,
+        }
+        with HISTORY.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    for line in found:
+        print(f"REGRESSION {line}")
+    for line in failures:
+        print(f"BUDGET {line}")
+    return 1 if found or failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
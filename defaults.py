@@ -13,6 +13,10 @@ DEFAULTS = {
         "optin_web_2_pct": 2,
         "optin_pos_pct": 2,
         "seasonality": [1.0]*12,
+        # Year-on-year growth for horizons beyond 12 months
+        "ridership_growth_pct": 0,
+        "digital_share_growth_pct": 0,
+        "optin_growth_pct": 0,
     },
     "retail": {
         "istat_monthly_spend_2023": 2738.0,
@@ -26,6 +30,8 @@ DEFAULTS = {
         "daily_receipts": 500,
         "stores": 100,
         "active_days": 360,
+        "volume_growth_pct": 0,
+        "optin_growth_pct": 0,
     },
     "fees": {
         "processor": "Adyen Giving",
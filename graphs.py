@@ -1,5 +1,9 @@
-import qrcode
-from PIL import Image, ImageDraw
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 
 def generate_rounded_qr_code(url: str, size: int = 500, border: int = 4, corner_radius: int = 20) -> Image.Image:
@@ -15,6 +19,10 @@ def generate_rounded_qr_code(url: str, size: int = 500, border: int = 4, corner_
     Returns:
         PIL Image object with rounded square QR code
     """
+    # qrcode and Pillow are only needed here, so importing this module stays cheap
+    import qrcode
+    from PIL import Image, ImageDraw
+
     # Create QR code instance
     qr = qrcode.QRCode(
         version=1,
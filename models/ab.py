@@ -1,19 +1,105 @@
+from functools import lru_cache
+
 import numpy as np
-from statsmodels.stats.power import NormalIndPower
+import pandas as pd
+
+from models.rail import RailInputs, RailParams, _compiled as _compiled_rail
+from models.retail import RetailInputs, RetailParams, _grid_params, _transactions_grid
+
+
+def _two_sided_power(standardized: np.ndarray, n: np.ndarray, crit: np.ndarray) -> np.ndarray:
+    # NormalIndPower.power for equal arms: both rejection tails of the z-test
+    from scipy.stats import norm
+
+    shift = standardized * np.sqrt(n / 2.0)
+    return norm.cdf(shift - crit) + norm.cdf(-shift - crit)
+
+
+@lru_cache(maxsize=4096)
+def _solve_power(standardized: float, alpha: float, power: float) -> float:
+    # Iterative root-finder, only for design points the closed form does not settle
+    from statsmodels.stats.power import NormalIndPower
+
+    try:
+        return float(NormalIndPower().solve_power(effect_size=standardized, alpha=alpha, power=power, alternative="two-sided"))
+    except Exception:
+        return np.nan
+
+
+def sample_sizes(p1, p2, alpha=0.05, power=0.8) -> np.ndarray:
+    """Per-arm sample size of a two-sided two-proportion z-test, for arrays of designs.
+
+    Arguments broadcast together. The closed-form normal approximation (one
+    rejection tail) is polished with Newton steps on the two-tailed power, which
+    reproduces statsmodels' NormalIndPower.solve_power; points that do not converge
+    fall back to it (cached). Zero effects give inf, power <= alpha gives nan.
+    """
+    # scipy.stats costs about a second to import, so it waits for the first plan
+    from scipy.stats import norm
+
+    p1, p2, alpha, power = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (p1, p2, alpha, power)))
+    pooled = np.sqrt(p1 * (1 - p1) + p2 * (1 - p2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        standardized = np.where(pooled > 0, np.abs(p2 - p1) / pooled, 0.0)
+        crit = norm.ppf(1 - alpha / 2)
+        n = 2.0 * ((crit + norm.ppf(power)) / standardized) ** 2
+
+        # Newton on sqrt(n) keeps the steps well scaled across effect sizes
+        root = np.sqrt(n)
+        for _ in range(3):
+            shift = standardized * root / np.sqrt(2.0)
+            slope = (norm.pdf(shift - crit) - norm.pdf(-shift - crit)) * standardized / np.sqrt(2.0)
+            root = root - (norm.cdf(shift - crit) + norm.cdf(-shift - crit) - power) / slope
+        n = root ** 2
+
+    # The power of a two-sided test never drops below alpha, so lower targets have no solution
+    solvable = standardized > 0
+    settled = np.abs(_two_sided_power(standardized, n, crit) - power) < 1e-9
+    out = np.where(solvable, n, np.inf)
+    out[solvable & (power <= alpha)] = np.nan
+    solvable &= power > alpha
+    for i in np.flatnonzero(solvable & ~(settled & np.isfinite(n) & (n > 0))):
+        out.flat[i] = _solve_power(float(standardized.flat[i]), float(alpha.flat[i]), float(power.flat[i]))
+    return out
 
 
 def sample_size_two_proportions(p1: float, p2: float, alpha: float = 0.05, power: float = 0.8) -> float:
-    effect = abs(p2 - p1)
-    if effect <= 0:
-        return np.inf
-    pooled = (p1 * (1 - p1) + p2 * (1 - p2)) ** 0.5
-    if pooled == 0:
-        return np.inf
-    standardized = effect / pooled
-    analysis = NormalIndPower()
-    n = analysis.solve_power(effect_size=standardized, alpha=alpha, power=power, alternative='two-sided')
-    return n
+    return float(sample_sizes(p1, p2, alpha, power))
+
+
+def rail_daily_traffic(inputs: RailInputs | RailParams) -> float:
+    # Ticket purchases per day that show the digital donation prompt
+    p = _compiled_rail(inputs)
+    return (p.trenitalia_riders + p.italo_riders) * p.eligible_share * p.digital_share / 365.0
 
 
+def retail_daily_traffic(inputs: RetailInputs | RetailParams) -> float:
+    # Checkout transactions per active day
+    p = _grid_params(inputs, {})
+    return float(_transactions_grid(p)[0] / p["active_days"][0])
 
 
+def plan_tests(
+    baseline, target, daily_traffic: float, alpha=0.05, power=0.8, variants: int = 2, traffic_share=1.0,
+) -> pd.DataFrame:
+    # One row per broadcast design point. Each challenger is compared with the control,
+    # so alpha is Bonferroni-split over variants - 1 comparisons
+    baseline, target, alpha, power, traffic_share = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (baseline, target, alpha, power, traffic_share))
+    )
+    n = sample_sizes(baseline, target, alpha / max(variants - 1, 1), power)
+    per_arm = np.ceil(n)
+    total = per_arm * variants
+    daily = daily_traffic * traffic_share
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = np.where(daily > 0, np.ceil(total / daily), np.inf)
+    return pd.DataFrame({
+        "baseline": baseline.ravel(),
+        "target": target.ravel(),
+        "lift": (target / baseline - 1.0).ravel(),
+        "alpha": alpha.ravel(),
+        "power": power.ravel(),
+        "n_per_variant": per_arm.ravel(),
+        "total_n": total.ravel(),
+        "days": days.ravel(),
+    })
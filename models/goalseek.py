@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.montecarlo import (
+    _RAIL_QUANTILES, _RETAIL_QUANTILES, _rail_draws, _rail_total_net, _retail_draws, _retail_total_net,
+)
+from models.rail import RailInputs, _avg_donation, rail_funnel
+from models.retail import RetailInputs, compute_retail_monthly
+from utils.profiling import PROFILER
+
+
+# Free inputs the solver can move: "initiative.field" -> (label, lower, upper). Net €
+# rises with each of them, which the bracket search relies on
+GOAL_PARAMS = {
+    "rail.optin_web_1": ("Rail web/app opt-in for €1", 0.0, 1.0),
+    "rail.optin_web_2": ("Rail web/app opt-in for €2", 0.0, 1.0),
+    "rail.digital_share": ("Rail digital share", 0.0, 1.0),
+    "rail.eligible_share": ("Rail eligible share shown the ask", 0.0, 1.0),
+    "retail.optin": ("Retail opt-in", 0.0, 1.0),
+    "retail.charm_prevalence": ("Retail charm-price prevalence", 0.0, 1.0),
+}
+ASK_TYPES = ("€1 fixed", "€2 fixed", "€1 or €2 choice")
+
+
+def _field(name: str) -> tuple[str, str]:
+    if name not in GOAL_PARAMS and name != "rail.ask_type":
+        raise ValueError(f"Unknown goal-seek parameter: {name}")
+    initiative, field = name.split(".", 1)
+    return initiative, field
+
+
+def _overrides(rail: RailInputs, free: str, grid: np.ndarray, sweep: Optional[str], sweep_values: np.ndarray) -> dict:
+    # Flat per-initiative parameter arrays for a (sweep row, candidate) block
+    out = {"rail": {}, "retail": {}}
+    initiative, field = _field(free)
+    out[initiative][field] = grid.ravel()
+    if sweep is not None:
+        initiative, field = _field(sweep)
+        if field == "ask_type":
+            field = "avg_donation"
+            sweep_values = [_avg_donation(t, rail.choice_share_eur1) for t in sweep_values]
+        out[initiative][field] = np.repeat(np.asarray(sweep_values, dtype=float), grid.shape[1])
+    return out
+
+
+def _bracket_solve(
+    fn: Callable[[np.ndarray], np.ndarray], lo: float, hi: float, rows: int, target: float, points: int, rounds: int,
+    interpolate: bool = True,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Smallest x per row with fn(x) >= target for fn increasing in x, by batched grid refinement.
+
+    fn maps a (rows, points) block of candidates to values of the same shape. Each round
+    evaluates every row's bracket in one call and keeps the cell where the target is
+    first crossed; the last cell is interpolated linearly, or its upper edge is returned
+    for step functions such as a sampled probability. Rows at the target on the lower
+    bound return it, rows short of it on the upper bound return nan. Also returns fn at
+    the upper edge, as evaluated in the last round.
+    """
+    steps = np.linspace(0.0, 1.0, points)
+    lo, hi = np.full(rows, float(lo)), np.full(rows, float(hi))
+    index = np.arange(rows)
+    for round_ in range(rounds):
+        grid = lo[:, None] + (hi - lo)[:, None] * steps
+        values = fn(grid)
+        reached = values >= target
+        if round_ == 0:
+            reachable = reached.any(axis=1)
+        # A later cell that is all below (sampling noise) keeps its upper edge
+        first = np.where(reached.any(axis=1), reached.argmax(axis=1), points - 1)
+        below = np.maximum(first - 1, 0)
+        v0, v1 = values[index, below], values[index, first]
+        lo, hi = grid[index, below], grid[index, first]
+    at_hi = np.where(reachable, v1, np.nan)
+    if not interpolate:
+        return np.where(reachable, hi, np.nan), at_hi
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.clip(np.where(v1 > v0, (target - v0) / (v1 - v0), 1.0), 0.0, 1.0)
+    return np.where(reachable, lo + t * (hi - lo), np.nan), at_hi
+
+
+def _overview_total(
+    rail: RailInputs, retail: RetailInputs, months: int, updates: dict, include_rail: bool, include_retail: bool,
+) -> float:
+    # Total net € of one solved row through the models the Overview renders rather than the batch kernels
+    total = 0.0
+    if include_rail:
+        total += float(rail_funnel(rail.model_copy(update=updates["rail"]), months=months).net.sum())
+    if include_retail:
+        frame = compute_retail_monthly(retail.model_copy(update=updates["retail"]), months=months)
+        total += float(frame.loc[(frame["metric"] == "net") & (frame["channel"] == "all"), "value"].sum())
+    return total
+
+
+def _sweep_values(sweep: Optional[str], values: Sequence) -> tuple[np.ndarray, dict]:
+    if sweep is None:
+        return np.zeros(1), {}
+    values = np.asarray(values, dtype=object if sweep == "rail.ask_type" else float)
+    return values, {sweep: values}
+
+
+@PROFILER.timed("model.goal_seek")
+def goal_seek(
+    rail: RailInputs,
+    retail: RetailInputs,
+    months: int,
+    target: float,
+    free: str,
+    sweep: Optional[str] = None,
+    sweep_values: Sequence = (),
+    include_rail: bool = True,
+    include_retail: bool = True,
+    points: int = 129,
+    rounds: int = 3,
+) -> pd.DataFrame:
+    """Value of `free` at which the total net € over the horizon (as on Overview) reaches `target`.
+
+    With `sweep` (another GOAL_PARAMS entry, or "rail.ask_type" with ASK_TYPES) the
+    target is solved once per sweep value, which traces the trade-off between two
+    inputs or compares ask types. Each refinement round is one batched model call.
+    """
+    values, columns = _sweep_values(sweep, sweep_values)
+    rail_params, retail_params = rail.compile(), retail.compile()
+    _, lo, hi = GOAL_PARAMS[free]
+
+    def totals(grid: np.ndarray) -> np.ndarray:
+        over = _overrides(rail, free, grid, sweep, values)
+        total = np.zeros(grid.size)
+        if include_rail:
+            total += _rail_total_net(rail_params, months, **over["rail"])
+        if include_retail:
+            total += _retail_total_net(retail_params, months, **over["retail"])
+        return total.reshape(grid.shape)
+
+    solved, _ = _bracket_solve(totals, lo, hi, len(values), target, points, rounds)
+
+    # Feed every solved value back through rail_funnel and the retail frame: the result
+    # must land on the target, or above it when the lower bound already reaches it
+    achieved = np.full(len(values), np.nan)
+    for i in np.flatnonzero(np.isfinite(solved)):
+        updates = {"rail": {}, "retail": {}}
+        for name, value in ((free, solved[i]), (sweep, values[i])):
+            if name is not None:
+                initiative, field = _field(name)
+                updates[initiative][field] = value
+        achieved[i] = _overview_total(rail, retail, months, updates, include_rail, include_retail)
+    solved_rows = np.isfinite(solved)
+    on_target = np.isclose(achieved, target, rtol=1e-6) | ((solved == lo) & (achieved >= target))
+    if (solved_rows & ~on_target).any():
+        raise RuntimeError(f"Goal seek for {free} does not reproduce the target {target:,.0f} in the full model")
+    return pd.DataFrame({**columns, free: solved, "total_net": achieved})
+
+
+@PROFILER.timed("model.goal_seek_probability")
+def goal_seek_probability(
+    rail: RailInputs,
+    retail: RetailInputs,
+    months: int,
+    target: float,
+    free: str,
+    probability: float = 0.8,
+    sweep: Optional[str] = None,
+    sweep_values: Sequence = (),
+    include_rail: bool = True,
+    include_retail: bool = True,
+    iterations: int = 2000,
+    seed: int | None = 42,
+    points: int = 17,
+    rounds: int = 3,
+) -> pd.DataFrame:
+    """Value of `free` at which P(total net € >= target) under the Monte Carlo model reaches `probability`.
+
+    One Monte Carlo sample of `iterations` draws (same distributions as run_monte_carlo)
+    is shared by every candidate. Inputs that the solver moves and that are uncertain
+    themselves (opt-in, digital share, charm prevalence) are drawn through their
+    inverse CDF from fixed uniforms, so each candidate gets the same quantiles around
+    its own centre and P rises monotonically with the candidate value. All candidates
+    of a round are evaluated as one block.
+    """
+    values, columns = _sweep_values(sweep, sweep_values)
+    _, lo, hi = GOAL_PARAMS[free]
+    rng = np.random.default_rng(seed)
+    initiatives = {}
+    if include_rail:
+        params = rail.compile()
+        initiatives["rail"] = (params, _rail_draws(params, rng, iterations), _RAIL_QUANTILES, _rail_total_net)
+    if include_retail:
+        params = retail.compile()
+        initiatives["retail"] = (params, _retail_draws(params, rng, iterations), _RETAIL_QUANTILES, _retail_total_net)
+    uniforms = {
+        (name, field): rng.random(iterations)
+        for name, (_, _, quantiles, _) in initiatives.items() for field in quantiles if f"{name}.{field}" in GOAL_PARAMS
+    }
+
+    def chance(grid: np.ndarray) -> np.ndarray:
+        # Candidates run down a (candidate, 1) column and broadcast against the shared
+        # (iteration,) draws in the batch kernels, so nothing is tiled
+        over = _overrides(rail, free, grid, sweep, values)
+        total = np.zeros((grid.size, iterations))
+        for name, (params, shared, quantiles, net_totals) in initiatives.items():
+            fixed = {k: v[:, None] for k, v in over[name].items()}
+            draws = {k: v for k, v in shared.items() if k not in fixed}
+            moved = replace(params, **{k: v.ravel() for k, v in over[name].items()})
+            draws.update({k: quantiles[k](uniforms[name, k], moved) for k in fixed if k in quantiles})
+            # An initiative without the free input yields one row that applies to every candidate
+            total += net_totals(params, months, **{**fixed, **draws}).reshape(-1, iterations)
+        return (total >= target).mean(axis=1).reshape(grid.shape)
+
+    # The upper edge of the last cell is a candidate that was evaluated and met the requirement
+    solved, achieved = _bracket_solve(chance, lo, hi, len(values), probability, points, rounds, interpolate=False)
+    return pd.DataFrame({**columns, free: solved, "probability": achieved})
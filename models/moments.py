@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import product
+from statistics import NormalDist
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.montecarlo import (
+    _CHARM_CLIP, _DIGITAL_CLIP, _beta_moments, _clipped_normal_moments, _rail_total_net, _retail_total_net,
+    run_monte_carlo,
+)
+from models.rail import RailInputs
+from models.retail import RetailInputs
+from utils.profiling import PROFILER
+
+
+# Uncertain inputs of the Monte Carlo model and the first three raw moments of their
+# draws. Seasonality is left out: it only moves net € between months (and, past 12
+# months, into a trailing partial year)
+_RAIL_MOMENTS = {
+    "optin_web_1": lambda p: _beta_moments(p.optin_web_1),
+    "optin_web_2": lambda p: _beta_moments(p.optin_web_2),
+    "digital_share": lambda p: _clipped_normal_moments(p.digital_share, _DIGITAL_CLIP),
+}
+_RETAIL_MOMENTS = {
+    "optin": lambda p: _beta_moments(p.optin),
+    "charm_prevalence": lambda p: _clipped_normal_moments(p.charm_prevalence, _CHARM_CLIP),
+}
+
+
+@dataclass(frozen=True)
+class MomentBands:
+    mean: float
+    sd: float
+    skew: float
+    q: tuple
+    percentiles: np.ndarray
+
+
+def _two_point(m1: float, m2: float, m3: float) -> tuple[np.ndarray, np.ndarray]:
+    # Values and probabilities of the two-point distribution with the same mean,
+    # variance and skewness
+    var = max(m2 - m1 * m1, 0.0)
+    sd = np.sqrt(var)
+    if sd == 0:
+        return np.array([m1, m1]), np.array([0.5, 0.5])
+    skew = (m3 - 3 * m1 * var - m1 ** 3) / sd ** 3
+    p = 0.5 * (1.0 - skew / np.sqrt(skew * skew + 4.0))
+    # The upper point (probability p) sits further out when the skew is positive
+    return m1 + sd * np.array([-np.sqrt(p / (1 - p)), np.sqrt((1 - p) / p)]), np.array([1 - p, p])
+
+
+def _net_moments(params, months: int, moments: dict, net_totals) -> np.ndarray:
+    # Net € is affine in each uncertain input (growth caps aside) and the inputs are
+    # independent, so its first three moments only depend on those of each input:
+    # replacing every input by a two-point draw with the same mean, variance and skew
+    # and evaluating all 2^k corners in one batched call gives them exactly
+    points = [_two_point(*moment(params)) for moment in moments.values()]
+    values = np.array(list(product(*(v for v, _ in points))))
+    weights = np.prod(list(product(*(w for _, w in points))), axis=1)
+    net = net_totals(params, months, **{name: values[:, i] for i, name in enumerate(moments)})
+    mean = weights @ net
+    centred = net - mean
+    return np.array([mean, weights @ centred ** 2, weights @ centred ** 3])
+
+
+@PROFILER.timed("model.moment_bands")
+def moment_bands(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    include_rail: bool = True,
+    include_retail: bool = True,
+    q: Sequence[float] = (5, 50, 95),
+) -> MomentBands:
+    """Percentiles of the Monte Carlo total net € without sampling.
+
+    Mean, variance and third central moment are propagated exactly through the rail
+    and retail funnel products and added (the initiatives are independent, so all
+    three cumulants add). The total is matched to a shifted gamma (Pearson III) with
+    the same three moments. A log-normal fitted to mean and variance alone puts the
+    5th percentile 9-15% too high with the default assumptions, because Beta opt-ins
+    are less skewed than a log-normal. analytic_check measures the remaining gap
+    against sampling.
+    """
+    from scipy.special import gammaincinv
+
+    mean, var, third = 0.0, 0.0, 0.0
+    if include_rail and rail_inputs is not None:
+        mean, var, third = np.array([mean, var, third]) + _net_moments(rail_inputs.compile(), months, _RAIL_MOMENTS, _rail_total_net)
+    if include_retail and retail_inputs is not None:
+        mean, var, third = np.array([mean, var, third]) + _net_moments(retail_inputs.compile(), months, _RETAIL_MOMENTS, _retail_total_net)
+
+    sd = float(np.sqrt(var))
+    skew = float(third / sd ** 3) if sd > 0 else 0.0
+    z = np.array([NormalDist().inv_cdf(p / 100.0) for p in q])
+    if abs(skew) < 1e-6:
+        percentiles = mean + sd * z
+    else:
+        # Gamma with shape 4/skew^2 standardised to mean 0 and sd 1, mirrored for negative skew
+        shape = 4.0 / skew ** 2
+        u = np.asarray(q, dtype=float) / 100.0
+        standard = (gammaincinv(shape, u if skew > 0 else 1.0 - u) - shape) / np.sqrt(shape)
+        percentiles = mean + sd * np.sign(skew) * standard
+    return MomentBands(mean=float(mean), sd=sd, skew=skew, q=tuple(q), percentiles=percentiles)
+
+
+@PROFILER.timed("model.analytic_check")
+def analytic_check(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    include_rail: bool = True,
+    include_retail: bool = True,
+    q: Sequence[float] = (5, 50, 95),
+    iterations: int = 16_384,
+    seed: int | None = 123,
+) -> pd.DataFrame:
+    # Analytic percentiles next to a scrambled Sobol run of the full model; deviation is relative to the sampled value
+    bands = moment_bands(rail_inputs, retail_inputs, months, include_rail, include_retail, q)
+    sampled = run_monte_carlo(
+        rail_inputs, retail_inputs, months, include_rail, include_retail, iterations=iterations, seed=seed, sampling="sobol",
+    )["total_net"].to_numpy()
+    sampled_q = np.percentile(sampled, q) if len(sampled) else np.zeros(len(q))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        deviation = np.where(sampled_q != 0, bands.percentiles / sampled_q - 1.0, 0.0)
+    return pd.DataFrame({
+        "percentile": [f"P{p:g}" for p in q],
+        "analytic": bands.percentiles,
+        "sampled": sampled_q,
+        "deviation": deviation,
+    })
@@ -1,14 +1,279 @@
 from __future__ import annotations
 
-from typing import Optional
+import math
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
+from typing import Callable, Iterator, Optional, Sequence
 
 import numpy as np
 import pandas as pd
 
-from models.rail import RailInputs, compute_rail_monthly
-from models.retail import RetailInputs, compute_retail_monthly
+from models.rail import RailInputs, RailParams, _compiled as _compiled_rail, _effective_optin, rail_net_totals
+from models.retail import RetailInputs, RetailParams, _compiled as _compiled_retail, retail_net_totals
+from utils.cache import input_hash
+from utils.mcstore import ResultStore, StoredRun
+from utils.profiling import PROFILER
 
 
+# Spread of the normal samplers and the ranges their draws are clipped to
+_SHARE_SD = 0.05
+_SEASON_CLIP = (0.7, 1.3)
+_DIGITAL_CLIP = (0.1, 0.99)
+_CHARM_CLIP = (0.6, 0.9)
+
+
+def _beta_shape(base):
+    return np.maximum(1, base * 100), np.maximum(1, (1 - base) * 100)
+
+
+def _beta_around(rng: np.random.Generator, base, size: int) -> np.ndarray:
+    # base may also be an array of `size` centres (one per draw)
+    return np.clip(rng.beta(*_beta_shape(base), size=size), 0, 1)
+
+
+# Samplers per uncertain input, in draw order; each is centred on the scenario value
+_RAIL_SAMPLERS = {
+    "optin_web_1": lambda rng, p, n: _beta_around(rng, p.optin_web_1, n),
+    "optin_web_2": lambda rng, p, n: _beta_around(rng, p.optin_web_2, n),
+    "seasonality": lambda rng, p, n: np.clip(p.seasonality + rng.normal(0, _SHARE_SD, size=(n, len(p.seasonality))), *_SEASON_CLIP),
+    "digital_share": lambda rng, p, n: np.clip(rng.normal(p.digital_share, _SHARE_SD, size=n), *_DIGITAL_CLIP),
+}
+_RETAIL_SAMPLERS = {
+    "optin": lambda rng, p, n: _beta_around(rng, p.optin, n),
+    "charm_prevalence": lambda rng, p, n: np.clip(rng.normal(p.charm_prevalence, _SHARE_SD, size=n), *_CHARM_CLIP),
+}
+
+
+def _beta_quantile(u: np.ndarray, base) -> np.ndarray:
+    # Inverse CDF of _beta_around for uniforms u; an array of centres adds a leading
+    # axis (centre, draw). Quantiles are computed on a ladder of levels (evenly spaced
+    # in normal scores) and interpolated, so betaincinv runs once per centre and level
+    # rather than per draw
+    from scipy.special import betaincinv, ndtr
+
+    levels = ndtr(np.linspace(-8.0, 8.0, 129))
+    base = np.asarray(base, dtype=float)[..., None]
+    table = np.clip(betaincinv(*_beta_shape(base), levels), 0, 1)
+    upper = np.clip(np.searchsorted(levels, u), 1, len(levels) - 1)
+    weight = np.clip((u - levels[upper - 1]) / (levels[upper] - levels[upper - 1]), 0.0, 1.0)
+    return table[..., upper - 1] * (1.0 - weight) + table[..., upper] * weight
+
+
+def _normal_quantile(u: np.ndarray, base, clip: tuple) -> np.ndarray:
+    from scipy.special import ndtri
+
+    return np.clip(np.asarray(base, dtype=float)[..., None] + _SHARE_SD * ndtri(u), *clip)
+
+
+def _season_quantile(u: np.ndarray, p: RailParams) -> np.ndarray:
+    from scipy.special import ndtri
+
+    return np.clip(p.seasonality + _SHARE_SD * ndtri(u), *_SEASON_CLIP)
+
+
+# Inverse-CDF forms of the samplers: uniforms -> the same distributions, for draws that
+# must stay coupled across scenarios or come from low-discrepancy points. Same order as
+# the samplers; seasonality takes one uniform per month, the others one each
+_RAIL_QUANTILES = {
+    "optin_web_1": lambda u, p: _beta_quantile(u, p.optin_web_1),
+    "optin_web_2": lambda u, p: _beta_quantile(u, p.optin_web_2),
+    "seasonality": _season_quantile,
+    "digital_share": lambda u, p: _normal_quantile(u, p.digital_share, _DIGITAL_CLIP),
+}
+_RETAIL_QUANTILES = {
+    "optin": lambda u, p: _beta_quantile(u, p.optin),
+    "charm_prevalence": lambda u, p: _normal_quantile(u, p.charm_prevalence, _CHARM_CLIP),
+}
+
+SAMPLING_MODES = ("random", "antithetic", "lhs", "sobol")
+
+
+def _uniforms(sampling: str, rng: np.random.Generator, size: int, dims: int) -> np.ndarray:
+    # (size, dims) points in the unit cube for the non-random sampling modes
+    if sampling == "antithetic":
+        # Mirrored pairs u, 1 - u: monotone outputs move in opposite directions
+        half = rng.random((-(-size // 2), dims))
+        return np.concatenate([half, 1.0 - half])[:size]
+    from scipy.stats import qmc
+
+    if sampling == "lhs":
+        return qmc.LatinHypercube(d=dims, seed=rng).random(size)
+    if sampling == "sobol":
+        with warnings.catch_warnings():
+            # Prefixes whose length is not a power of two are valid, only slightly less balanced
+            warnings.filterwarnings("ignore", message="The balance properties")
+            return qmc.Sobol(d=dims, scramble=True, seed=rng).random(size)
+    raise ValueError(f"Unknown sampling mode: {sampling}")
+
+
+def _quantile_draws(quantiles: dict, params, u: np.ndarray) -> dict:
+    draws, col = {}, 0
+    for name, quantile in quantiles.items():
+        width = len(params.seasonality) if name == "seasonality" else 1
+        block = u[:, col:col + width]
+        draws[name] = quantile(block if width > 1 else block[:, 0], params)
+        col += width
+    return draws
+
+
+def _rail_draws(inputs: RailParams, rng: np.random.Generator, iterations: int, fields: Optional[Sequence[str]] = None) -> dict:
+    return {name: draw(rng, inputs, iterations) for name, draw in _RAIL_SAMPLERS.items() if fields is None or name in fields}
+
+
+def _retail_draws(inputs: RetailParams, rng: np.random.Generator, iterations: int, fields: Optional[Sequence[str]] = None) -> dict:
+    return {name: draw(rng, inputs, iterations) for name, draw in _RETAIL_SAMPLERS.items() if fields is None or name in fields}
+
+
+def _rail_total_net(inputs: RailInputs | RailParams, months: int, **params) -> np.ndarray:
+    return rail_net_totals(inputs, months=months, **params)
+
+
+def _retail_total_net(inputs: RetailInputs | RetailParams, months: int, **params) -> np.ndarray:
+    return retail_net_totals(inputs, months=months, **params)
+
+
+def _chunk_columns(
+    rail_inputs: Optional[RailParams],
+    retail_inputs: Optional[RetailParams],
+    months: int,
+    size: int,
+    seed_seq: np.random.SeedSequence,
+    sampling: str = "random",
+) -> dict:
+    # Draws and per-iteration outputs of one chunk; module-level so process pool
+    # workers can unpickle it
+    rng = np.random.default_rng(seed_seq)
+    if sampling == "random":
+        rail_draws = _rail_draws(rail_inputs, rng, size) if rail_inputs is not None else None
+        retail_draws = _retail_draws(retail_inputs, rng, size) if retail_inputs is not None else None
+    else:
+        # One point set over every uncertain input, mapped through the inverse CDFs
+        rail_dims = len(_RAIL_QUANTILES) - 1 + len(rail_inputs.seasonality) if rail_inputs is not None else 0
+        u = _uniforms(sampling, rng, size, rail_dims + (len(_RETAIL_QUANTILES) if retail_inputs is not None else 0))
+        rail_draws = _quantile_draws(_RAIL_QUANTILES, rail_inputs, u[:, :rail_dims]) if rail_inputs is not None else None
+        retail_draws = _quantile_draws(_RETAIL_QUANTILES, retail_inputs, u[:, rail_dims:]) if retail_inputs is not None else None
+
+    columns = {}
+    total_net = np.zeros(size)
+    if rail_draws is not None:
+        columns.update({f"rail_{name}": value for name, value in rail_draws.items()})
+        columns["rail_net"] = _rail_total_net(rail_inputs, months, **rail_draws)
+        total_net += columns["rail_net"]
+    if retail_draws is not None:
+        columns.update({f"retail_{name}": value for name, value in retail_draws.items()})
+        columns["retail_net"] = _retail_total_net(retail_inputs, months, **retail_draws)
+        total_net += columns["retail_net"]
+    columns["total_net"] = total_net
+    return columns
+
+
+def _chunk_net_totals(
+    rail_inputs: Optional[RailParams],
+    retail_inputs: Optional[RetailParams],
+    months: int,
+    size: int,
+    seed_seq: np.random.SeedSequence,
+    sampling: str = "random",
+) -> np.ndarray:
+    return _chunk_columns(rail_inputs, retail_inputs, months, size, seed_seq, sampling)["total_net"]
+
+
+def _beta_moments(base: float) -> tuple[float, float, float]:
+    # First three raw moments of _beta_around (the clip to [0, 1] never binds)
+    a, b = _beta_shape(base)
+    n = a + b
+    return float(a / n), float(a * (a + 1) / (n * (n + 1))), float(a * (a + 1) * (a + 2) / (n * (n + 1) * (n + 2)))
+
+
+def _clipped_normal_moments(mu: float, clip: tuple) -> tuple[float, float, float]:
+    # First three raw moments of clip(N(mu, _SHARE_SD), lo, hi): the clipped tails are
+    # point masses at the bounds, the inside is a truncated normal
+    sd = _SHARE_SD
+    lo, hi = clip
+    a, b = (lo - mu) / sd, (hi - mu) / sd
+    cdf = lambda z: 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
+    pdf = lambda z: math.exp(-0.5 * z * z) / math.sqrt(2.0 * math.pi)
+    # E[Z^k; a < Z < b] for k = 0..3
+    z0 = cdf(b) - cdf(a)
+    z1 = pdf(a) - pdf(b)
+    z2 = z0 + a * pdf(a) - b * pdf(b)
+    z3 = (a * a + 2.0) * pdf(a) - (b * b + 2.0) * pdf(b)
+    below, above = cdf(a), 1.0 - cdf(b)
+    return (
+        lo * below + hi * above + mu * z0 + sd * z1,
+        lo ** 2 * below + hi ** 2 * above + mu ** 2 * z0 + 2 * mu * sd * z1 + sd ** 2 * z2,
+        lo ** 3 * below + hi ** 3 * above + mu ** 3 * z0 + 3 * mu ** 2 * sd * z1 + 3 * mu * sd ** 2 * z2 + sd ** 3 * z3,
+    )
+
+
+def _controls(columns, rail: Optional[RailParams], retail: Optional[RetailParams]) -> tuple[list, list]:
+    # Per-iteration control quantities with closed-form means: the sampled inputs and the
+    # products that drive net € (digital share x effective opt-in for rail, opt-in x
+    # charm prevalence for retail), whose means factor because the draws are independent
+    values, means = [], []
+    if rail is not None:
+        o1, o2, digital = columns["rail_optin_web_1"], columns["rail_optin_web_2"], columns["rail_digital_share"]
+        m1, m2 = _beta_moments(rail.optin_web_1)[0], _beta_moments(rail.optin_web_2)[0]
+        md = _clipped_normal_moments(rail.digital_share, _DIGITAL_CLIP)[0]
+        optin = _effective_optin(np.asarray(rail.avg_donation), np.asarray(o1), np.asarray(o2))
+        values += [o1, o2, digital, np.asarray(digital) * optin]
+        means += [m1, m2, md, md * _effective_optin(rail.avg_donation, m1, m2)]
+    if retail is not None:
+        optin, charm = columns["retail_optin"], columns["retail_charm_prevalence"]
+        mo, mc = _beta_moments(retail.optin)[0], _clipped_normal_moments(retail.charm_prevalence, _CHARM_CLIP)[0]
+        values += [optin, charm, np.asarray(optin) * np.asarray(charm)]
+        means += [mo, mc, mo * mc]
+    return values, means
+
+
+def control_variate_weights(
+    columns, rail_inputs: Optional[RailInputs | RailParams], retail_inputs: Optional[RetailInputs | RetailParams],
+) -> np.ndarray:
+    """Control-variate weights for the iterations of a run (Hesterberg & Nelson).
+
+    `columns` maps the prefixed draw names of _chunk_columns (a StoredRun works) to
+    arrays. The weights sum to one and make the weighted means of the controls equal
+    their known means, so weighted means and percentiles of any output carry less
+    sampling error. Weights can be slightly negative.
+    """
+    rail = _compiled_rail(rail_inputs) if rail_inputs is not None else None
+    retail = _compiled_retail(retail_inputs) if retail_inputs is not None else None
+    values, means = _controls(columns, rail, retail)
+    x = np.column_stack(values) - np.asarray(means)
+    centred = x - x.mean(axis=0)
+    cov = centred.T @ centred / len(x)
+    # lstsq copes with controls that do not vary (inputs pinned at a bound)
+    coef = np.linalg.lstsq(cov, x.mean(axis=0), rcond=None)[0]
+    return (1.0 - centred @ coef) / len(x)
+
+
+# Iterations per independent random stream; fixed so that results for a seed
+# do not depend on how many workers evaluate the chunks
+MC_CHUNK_SIZE = 250_000
+
+
+def _iter_chunks(
+    fn: Callable, rail: Optional[RailParams], retail: Optional[RetailParams], months: int,
+    iterations: int, seed, workers: int | None, sampling: str = "random",
+) -> Iterator:
+    # Every chunk draws from its own spawned stream; results come back in chunk order
+    sizes = [min(MC_CHUNK_SIZE, iterations - start) for start in range(0, iterations, MC_CHUNK_SIZE)]
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+
+    if workers <= 1:
+        for size, stream in zip(sizes, streams):
+            yield fn(rail, retail, months, size, stream, sampling)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            n = len(sizes)
+            yield from pool.map(fn, [rail] * n, [retail] * n, [months] * n, sizes, streams, [sampling] * n)
+
+
+@PROFILER.timed("model.monte_carlo")
 def run_monte_carlo(
     rail_inputs: Optional[RailInputs],
     retail_inputs: Optional[RetailInputs],
@@ -16,11 +281,15 @@ def run_monte_carlo(
     include_rail: bool = True,
     include_retail: bool = True,
     iterations: int = 2000,
-    seed: int | None = None
+    seed: int | None = None,
+    workers: int | None = 1,
+    sampling: str = "random",
+    control_variates: bool = False,
 ) -> pd.DataFrame:
-    rng = np.random.default_rng(seed)
-    results = []
-
+    # sampling is one of SAMPLING_MODES. With control_variates the frame gets a "weight"
+    # column (control_variate_weights) to use in weighted means and percentiles
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
     if include_rail and rail_inputs is None:
         include_rail = False
     if include_retail and retail_inputs is None:
@@ -29,45 +298,218 @@ def run_monte_carlo(
     if not include_rail and not include_retail:
         return pd.DataFrame({"total_net": []})
 
-    for _ in range(iterations):
-        total_net = 0.0
+    # Validated inputs are compiled once here; chunks and workers only see the parameter blocks
+    rail = rail_inputs.compile() if include_rail else None
+    retail = retail_inputs.compile() if include_retail else None
+
+    if control_variates:
+        chunks = list(_iter_chunks(_chunk_columns, rail, retail, months, iterations, seed, workers, sampling))
+        columns = {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}
+        return pd.DataFrame({"total_net": columns["total_net"], "weight": control_variate_weights(columns, rail, retail)})
+
+    chunks = list(_iter_chunks(_chunk_net_totals, rail, retail, months, iterations, seed, workers, sampling))
+    total_net = np.concatenate(chunks) if chunks else np.zeros(0)
+    return pd.DataFrame({"total_net": total_net})
+
+
+@PROFILER.timed("model.monte_carlo_stored")
+def run_monte_carlo_stored(
+    store: ResultStore,
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    include_rail: bool = True,
+    include_retail: bool = True,
+    iterations: int = 2000,
+    seed: int | None = None,
+    workers: int | None = 1,
+    sampling: str = "random",
+    control_variates: bool = False,
+) -> Optional[StoredRun]:
+    # Same draws as run_monte_carlo, plus every per-iteration draw and output, written
+    # chunk by chunk to memory-mapped columns. Runs are keyed by the scenario, seed and
+    # iteration count, so repeats (across restarts too) just reopen the files
+    rail_inputs = rail_inputs if include_rail else None
+    retail_inputs = retail_inputs if include_retail else None
+    if rail_inputs is None and retail_inputs is None:
+        return None
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    # Pseudo-random runs keep the keys they were stored under before sampling modes existed
+    extra = (() if sampling == "random" else (sampling,)) + (("control_variates",) if control_variates else ())
+    key = input_hash("monte_carlo", rail_inputs, retail_inputs, months, iterations, seed, *extra)
+    run = store.get(key)
+    if run is not None:
+        return run
+
+    rail = rail_inputs.compile() if rail_inputs is not None else None
+    retail = retail_inputs.compile() if retail_inputs is not None else None
+    chunks = _iter_chunks(_chunk_columns, rail, retail, months, iterations, seed, workers, sampling)
+    first = next(chunks)
+    columns = {name: (value.dtype, value.shape[1:]) for name, value in first.items()}
+    if control_variates:
+        columns["weight"] = (np.dtype(float), ())
+    meta = {"months": months, "iterations": iterations, "seed": seed, "sampling": sampling}
+    with store.writer(key, iterations, columns, meta) as out:
+        start = 0
+        for chunk in chain([first], chunks):
+            size = len(chunk["total_net"])
+            for name, value in chunk.items():
+                out[name][start:start + size] = value
+            start += size
+        if control_variates:
+            out["weight"][:] = control_variate_weights(out, rail, retail)
+    return store.get(key)
+
+
+class StreamingSummary:
+    """Constant-memory running summary of Monte Carlo totals.
 
-        if include_rail:
-            base_opt1 = rail_inputs.optin_web_1
-            base_opt2 = rail_inputs.optin_web_2
-            opt1 = np.clip(rng.beta(max(1, base_opt1 * 100), max(1, (1 - base_opt1) * 100)), 0, 1)
-            opt2 = np.clip(rng.beta(max(1, base_opt2 * 100), max(1, (1 - base_opt2) * 100)), 0, 1)
+    Mean and variance are merged batch by batch (Chan et al.); quantiles come from a
+    fixed-size histogram sketch whose range doubles whenever a batch falls outside it.
+    """
 
-            base_season = np.array(rail_inputs.seasonality)
-            seasonality = np.clip(base_season + rng.normal(0, 0.05, size=len(base_season)), 0.7, 1.3).tolist()
-            digital_share = np.clip(rng.normal(rail_inputs.digital_share, 0.05), 0.1, 0.99)
+    def __init__(self, bins: int = 4096):
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.lo = 0.0
+        self.width = 0.0
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
 
-            rail_inputs_mc = rail_inputs.model_copy()
-            rail_inputs_mc.optin_web_1 = opt1
-            rail_inputs_mc.optin_web_2 = opt2
-            rail_inputs_mc.seasonality = seasonality
-            rail_inputs_mc.digital_share = digital_share
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
 
-            rail_df = compute_rail_monthly(rail_inputs_mc, months=months)
-            total_net += rail_df[rail_df["metric"] == "net"]["value"].sum()
+    def _grow(self, lo: float, hi: float) -> None:
+        # Doubling keeps old bin edges aligned, so pairs of bins merge exactly
+        while lo < self.lo:
+            self.lo -= self.width * self.bins
+            self.counts = np.concatenate([np.zeros(self.bins, dtype=np.int64), self.counts]).reshape(-1, 2).sum(axis=1)
+            self.width *= 2
+        while hi >= self.lo + self.width * self.bins:
+            self.counts = np.concatenate([self.counts, np.zeros(self.bins, dtype=np.int64)]).reshape(-1, 2).sum(axis=1)
+            self.width *= 2
 
-        if include_retail:
-            base_opt_retail = retail_inputs.optin
-            opt_retail = np.clip(rng.beta(max(1, base_opt_retail * 100), max(1, (1 - base_opt_retail) * 100)), 0, 1)
-            base_prevalence = retail_inputs.charm_prevalence
-            prevalence = np.clip(rng.normal(base_prevalence, 0.05), 0.6, 0.9)
+    def update(self, batch: np.ndarray) -> None:
+        if len(batch) == 0:
+            return
+        b_min, b_max = float(batch.min()), float(batch.max())
+        if self.n == 0:
+            span = max(b_max - b_min, abs(b_max) * 1e-9, 1e-9)
+            self.lo = b_min - 0.25 * span
+            self.width = 1.5 * span / self.bins
+        self._grow(b_min, b_max)
+        idx = np.minimum(((batch - self.lo) / self.width).astype(np.int64), self.bins - 1)
+        self.counts += np.bincount(idx, minlength=self.bins)
 
-            retail_inputs_mc = retail_inputs.model_copy()
-            retail_inputs_mc.optin = opt_retail
-            retail_inputs_mc.charm_prevalence = prevalence
+        b_n = len(batch)
+        b_mean = float(batch.mean())
+        b_m2 = float(((batch - b_mean) ** 2).sum())
+        total = self.n + b_n
+        delta = b_mean - self.mean
+        self.mean += delta * b_n / total
+        self._m2 += b_m2 + delta ** 2 * self.n * b_n / total
+        self.n = total
+        self.min = min(self.min, b_min)
+        self.max = max(self.max, b_max)
 
-            retail_df = compute_retail_monthly(retail_inputs_mc, months=months)
-            total_net += retail_df[(retail_df["metric"] == "net") & (retail_df["channel"] == "all")]["value"].sum()
+    def quantile(self, q) -> np.ndarray:
+        # q in [0, 1]; linear interpolation inside the sketch bin holding the rank
+        q = np.clip(np.asarray(q, dtype=float), 0.0, 1.0)
+        cum = np.cumsum(self.counts)
+        rank = q * self.n
+        i = np.minimum(np.searchsorted(cum, rank, side="left"), self.bins - 1)
+        before = np.where(i > 0, cum[i - 1], 0)
+        frac = np.where(self.counts[i] > 0, (rank - before) / np.maximum(self.counts[i], 1), 0.0)
+        return np.clip(self.lo + self.width * (i + frac), self.min, self.max)
 
-        results.append({"total_net": float(total_net)})
+    def quantile_ci(self, q, z: float = 1.96) -> tuple[np.ndarray, np.ndarray]:
+        # Distribution-free interval from the binomial spread of the order statistic rank
+        q = np.asarray(q, dtype=float)
+        spread = z * np.sqrt(q * (1 - q) / max(self.n, 1))
+        return self.quantile(q - spread), self.quantile(q + spread)
 
-    return pd.DataFrame(results)
+    def histogram(self, nbins: int = 60) -> tuple[np.ndarray, np.ndarray]:
+        # Coarsen the sketch onto nbins equal bins over the observed range
+        edges = np.linspace(self.min, self.max, nbins + 1)
+        centers = self.lo + self.width * (np.arange(self.bins) + 0.5)
+        counts, _ = np.histogram(np.clip(centers, self.min, self.max), bins=edges, weights=self.counts)
+        return edges, counts
 
 
+@dataclass
+class StreamingResult:
+    summary: StreamingSummary
+    percentiles: np.ndarray
+    percentile_values: np.ndarray
+    half_widths: np.ndarray
+    converged: bool
 
+    @property
+    def iterations(self) -> int:
+        return self.summary.n
 
+
+def stream_monte_carlo(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    include_rail: bool = True,
+    include_retail: bool = True,
+    percentiles: Sequence[float] = (5, 50, 95),
+    rel_tol: float = 0.01,
+    batch_size: int = 10_000,
+    max_iterations: int = 1_000_000,
+    seed: int | None = None,
+) -> Iterator[tuple[np.ndarray, StreamingResult]]:
+    # Yields each batch with the running result; stops once every requested percentile's
+    # 95% interval half-width is within rel_tol of its value, or at max_iterations
+    rail = rail_inputs.compile() if include_rail and rail_inputs is not None else None
+    retail = retail_inputs.compile() if include_retail and retail_inputs is not None else None
+    if rail is None and retail is None:
+        return
+
+    q = np.asarray(percentiles, dtype=float) / 100.0
+    root = np.random.SeedSequence(seed)
+    summary = StreamingSummary()
+    while summary.n < max_iterations:
+        size = min(batch_size, max_iterations - summary.n)
+        batch = _chunk_net_totals(rail, retail, months, size, root.spawn(1)[0])
+        summary.update(batch)
+
+        values = summary.quantile(q)
+        low, high = summary.quantile_ci(q)
+        half_widths = (high - low) / 2.0
+        converged = bool(np.all(half_widths <= rel_tol * np.abs(values)))
+        yield batch, StreamingResult(summary, np.asarray(percentiles, dtype=float), values, half_widths, converged)
+        if converged:
+            return
+
+
+@PROFILER.timed("model.monte_carlo_streaming")
+def run_monte_carlo_streaming(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    include_rail: bool = True,
+    include_retail: bool = True,
+    percentiles: Sequence[float] = (5, 50, 95),
+    rel_tol: float = 0.01,
+    batch_size: int = 10_000,
+    max_iterations: int = 1_000_000,
+    seed: int | None = None,
+) -> Optional[StreamingResult]:
+    result = None
+    for _, result in stream_monte_carlo(
+        rail_inputs, retail_inputs, months, include_rail, include_retail,
+        percentiles, rel_tol, batch_size, max_iterations, seed,
+    ):
+        pass
+    return result
@@ -1,9 +1,12 @@
+from dataclasses import dataclass
 from typing import List, Literal
 
 import numpy as np
 import pandas as pd
 from pydantic import BaseModel, Field, model_validator
 
+from utils.profiling import PROFILER
+
 
 AskType = Literal["€1 fixed", "€2 fixed", "€1 or €2 choice"]
 
@@ -22,6 +25,10 @@ class RailInputs(BaseModel):
     fee_rate: float = Field(0.0, ge=0.0, le=1.0)
     fee_fixed: float = Field(0.0, ge=0.0)
     processor: str = "Adyen Giving"
+    # Year-on-year growth applied from the second projection year onwards
+    ridership_growth: float = Field(0.0, ge=-1.0)
+    digital_share_growth: float = Field(0.0, ge=-1.0)
+    optin_growth: float = Field(0.0, ge=-1.0)
 
     @model_validator(mode="after")
     def validate_seasonality(self):
@@ -29,6 +36,48 @@ class RailInputs(BaseModel):
             raise ValueError("Seasonality must have 12 values")
         return self
 
+    def compile(self) -> "RailParams":
+        seasonality = np.array(self.seasonality, dtype=float)
+        seasonality.flags.writeable = False
+        return RailParams(
+            trenitalia_riders=float(self.trenitalia_riders),
+            italo_riders=float(self.italo_riders),
+            digital_share=self.digital_share,
+            eligible_share=self.eligible_share,
+            avg_donation=_avg_donation(self.ask_type, self.choice_share_eur1),
+            optin_web_1=self.optin_web_1,
+            optin_web_2=self.optin_web_2,
+            seasonality=seasonality,
+            fee_rate=self.fee_rate,
+            fee_fixed=self.fee_fixed,
+            ridership_growth=self.ridership_growth,
+            digital_share_growth=self.digital_share_growth,
+            optin_growth=self.optin_growth,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class RailParams:
+    # Validated RailInputs flattened to plain floats for the kernels and samplers, so
+    # pydantic is paid once per scenario rather than once per draw
+    trenitalia_riders: float
+    italo_riders: float
+    digital_share: float
+    eligible_share: float
+    avg_donation: float
+    optin_web_1: float
+    optin_web_2: float
+    seasonality: np.ndarray
+    fee_rate: float
+    fee_fixed: float
+    ridership_growth: float
+    digital_share_growth: float
+    optin_growth: float
+
+
+def _compiled(inputs: "RailInputs | RailParams") -> RailParams:
+    return inputs if isinstance(inputs, RailParams) else inputs.compile()
+
 
 def _avg_donation(ask_type: AskType, choice_share_eur1: float) -> float:
     if ask_type == "€1 fixed":
@@ -38,60 +87,159 @@ def _avg_donation(ask_type: AskType, choice_share_eur1: float) -> float:
     return 1.0 * choice_share_eur1 + 2.0 * (1.0 - choice_share_eur1)
 
 
-def compute_rail_monthly(inputs: RailInputs, months: int = 12) -> pd.DataFrame:
-    total_riders = inputs.trenitalia_riders + inputs.italo_riders
-    seasonality = np.array(inputs.seasonality, dtype=float)
-    seasonality = seasonality / seasonality.sum()
-    avg_donation = _avg_donation(inputs.ask_type, inputs.choice_share_eur1)
-    
+def _effective_optin(avg_donation: float, optin_web_1, optin_web_2):
+    # Effective opt-in approximated by weighted average of €1/€2 rates.
+    # Works element-wise when the opt-in rates are NumPy arrays.
+    if np.ndim(avg_donation):
+        # One average donation per scenario (batched ask types)
+        blend = optin_web_1 * (2.0 - avg_donation) + optin_web_2 * (avg_donation - 1.0)
+        return np.where(avg_donation <= 1.05, optin_web_1, np.where(avg_donation >= 1.95, optin_web_2, blend))
+    if avg_donation <= 1.05:
+        return optin_web_1
+    if avg_donation >= 1.95:
+        return optin_web_2
+    # blend
+    w1 = (2.0 - avg_donation)
+    w2 = (avg_donation - 1.0)
+    return optin_web_1 * w1 + optin_web_2 * w2
+
+
+def _season_weights(seasonality, months: int) -> np.ndarray:
+    # Normalise the 12 multipliers to shares of the year; the last axis is months,
+    # so a (n, 12) block of per-iteration seasonality is normalised row by row
+    weights = np.asarray(seasonality, dtype=float)
+    weights = weights / weights.sum(axis=-1, keepdims=True)
+
     # Adjust seasonality for partial year
     if months < 12:
-        seasonality = seasonality[:months]
-        seasonality = seasonality / seasonality.sum()
-
-    rows = []
-    for m in range(months):
-        monthly_riders = total_riders * seasonality[m]
-        eligible = monthly_riders * inputs.eligible_share
-        exposed_digital = eligible * inputs.digital_share
-
-        # Assume all donations happen on digital in this model; POS shown as separate opt-in level
-        # Effective opt-in approximated by weighted average of €1/€2 rates
-        if avg_donation <= 1.05:
-            optin = inputs.optin_web_1
-        elif avg_donation >= 1.95:
-            optin = inputs.optin_web_2
-        else:
-            # blend
-            w1 = (2.0 - avg_donation)
-            w2 = (avg_donation - 1.0)
-            optin = (inputs.optin_web_1 * w1 + inputs.optin_web_2 * w2)
-
-        donors = exposed_digital * optin
-        gross = donors * avg_donation
-        net = gross * (1.0 - inputs.fee_rate) - inputs.fee_fixed * donors
-
-        rows.extend([
-            {"month": m + 1, "year": 1, "operator": "all", "channel": "digital", "metric": "riders", "value": monthly_riders},
-            {"month": m + 1, "year": 1, "operator": "all", "channel": "digital", "metric": "eligible", "value": eligible},
-            {"month": m + 1, "year": 1, "operator": "all", "channel": "digital", "metric": "exposed_digital", "value": exposed_digital},
-            {"month": m + 1, "year": 1, "operator": "all", "channel": "digital", "metric": "donors", "value": donors},
-            {"month": m + 1, "year": 1, "operator": "all", "channel": "digital", "metric": "gross", "value": gross},
-            {"month": m + 1, "year": 1, "operator": "all", "channel": "digital", "metric": "net", "value": net},
-        ])
-
-    # Split annual net by operator proportionally by riders for the bar chart
-    df = pd.DataFrame(rows)
-    ratio_tr = inputs.trenitalia_riders / max(total_riders, 1)
-    ratio_it = inputs.italo_riders / max(total_riders, 1)
-    annual_net = df[df["metric"] == "net"]["value"].sum()
-    rows_extra = [
-        {"month": 0, "year": 1, "operator": "Trenitalia", "channel": "digital", "metric": "net", "value": annual_net * ratio_tr},
-        {"month": 0, "year": 1, "operator": "Italo", "channel": "digital", "metric": "net", "value": annual_net * ratio_it},
-    ]
-    df = pd.concat([df, pd.DataFrame(rows_extra)], ignore_index=True)
-    return df
-
-
-
-
+        weights = weights[..., :months]
+        weights = weights / weights.sum(axis=-1, keepdims=True)
+    elif months > 12:
+        # Later years repeat the pattern; a trailing partial year keeps its months' share
+        weights = np.concatenate([weights] * -(-months // 12), axis=-1)[..., :months]
+    return weights
+
+
+def _year_index(months: int) -> np.ndarray:
+    # 0-based projection year of every month
+    return np.arange(months) // 12
+
+
+def _grown(value, growth, years: np.ndarray, cap: float | None = None):
+    # Compound yearly growth along a trailing year/month axis; shares are capped at 1
+    value = np.asarray(value, dtype=float)[..., None] * (1.0 + np.asarray(growth, dtype=float)[..., None]) ** years
+    return value if cap is None else np.minimum(value, cap)
+
+
+FUNNEL_METRICS = ("riders", "eligible", "exposed_digital", "donors", "gross", "net")
+
+
+@dataclass(frozen=True)
+class RailFunnel:
+    riders: np.ndarray
+    eligible: np.ndarray
+    exposed_digital: np.ndarray
+    donors: np.ndarray
+    gross: np.ndarray
+    net: np.ndarray
+    trenitalia_share: float
+    italo_share: float
+
+    @property
+    def months(self) -> int:
+        return len(self.net)
+
+    def operator_net(self) -> dict:
+        # Split annual net by operator proportionally by riders for the bar chart
+        annual_net = float(self.net.sum())
+        return {"Trenitalia": annual_net * self.trenitalia_share, "Italo": annual_net * self.italo_share}
+
+    @PROFILER.timed("dataframe.rail_frame")
+    def to_frame(self) -> pd.DataFrame:
+        months = self.months
+        n_metrics = len(FUNNEL_METRICS)
+        # Month-major, metric-minor: the row order of the original per-month dicts
+        values = np.column_stack([getattr(self, metric) for metric in FUNNEL_METRICS]).ravel()
+        df = pd.DataFrame({
+            "month": np.repeat(np.arange(1, months + 1), n_metrics),
+            "year": np.repeat(_year_index(months) + 1, n_metrics),
+            "operator": "all",
+            "channel": "digital",
+            "metric": np.tile(FUNNEL_METRICS, months),
+            "value": values,
+        })
+        split = self.operator_net()
+        rows_extra = pd.DataFrame({
+            "month": 0,
+            "year": 1,
+            "operator": list(split),
+            "channel": "digital",
+            "metric": "net",
+            "value": list(split.values()),
+        })
+        return pd.concat([df, rows_extra], ignore_index=True)
+
+
+@PROFILER.timed("model.rail_funnel")
+def rail_funnel(inputs: RailInputs | RailParams, months: int = 12) -> RailFunnel:
+    p = _compiled(inputs)
+    total_riders = p.trenitalia_riders + p.italo_riders
+
+    # Assume all donations happen on digital in this model; POS shown as separate opt-in level
+    optin = _effective_optin(p.avg_donation, p.optin_web_1, p.optin_web_2)
+
+    # Whole horizon in one pass: seasonality is tiled across years and each month
+    # carries its year's growth factors
+    years = _year_index(months)
+    riders = total_riders * _season_weights(p.seasonality, months) * _grown(1.0, p.ridership_growth, years)
+    eligible = riders * p.eligible_share
+    exposed_digital = eligible * _grown(p.digital_share, p.digital_share_growth, years, cap=1.0)
+    donors = exposed_digital * _grown(optin, p.optin_growth, years, cap=1.0)
+    gross = donors * p.avg_donation
+    net = gross * (1.0 - p.fee_rate) - p.fee_fixed * donors
+
+    return RailFunnel(
+        riders=riders,
+        eligible=eligible,
+        exposed_digital=exposed_digital,
+        donors=donors,
+        gross=gross,
+        net=net,
+        trenitalia_share=p.trenitalia_riders / max(total_riders, 1),
+        italo_share=p.italo_riders / max(total_riders, 1),
+    )
+
+
+def compute_rail_monthly(inputs: RailInputs | RailParams, months: int = 12) -> pd.DataFrame:
+    return rail_funnel(inputs, months=months).to_frame()
+
+
+_BATCH_PARAMS = (
+    "trenitalia_riders", "italo_riders", "digital_share", "eligible_share",
+    "optin_web_1", "optin_web_2", "fee_rate", "fee_fixed",
+    "ridership_growth", "digital_share_growth", "optin_growth", "avg_donation",
+)
+
+
+@PROFILER.timed("model.rail_net_totals")
+def rail_net_totals(base: RailInputs | RailParams, months: int = 12, seasonality=None, **params) -> np.ndarray:
+    # Net € over the horizon for many scenarios at once: fields in _BATCH_PARAMS may be
+    # arrays that broadcast together, seasonality may be an (n, 12) block of multipliers.
+    # Growth is constant within a year, so months collapse to per-year seasonal weights
+    # and the horizon is a (scenario, year) block
+    unknown = set(params) - set(_BATCH_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown rail batch parameters: {sorted(unknown)}")
+
+    base = _compiled(base)
+    p = {name: np.asarray(params.get(name, getattr(base, name)), dtype=float) for name in _BATCH_PARAMS}
+    weights = _season_weights(base.seasonality if seasonality is None else seasonality, months)
+    weights = np.add.reduceat(weights, np.arange(0, months, 12), axis=-1)
+    years = np.arange(weights.shape[-1])
+    optin = _effective_optin(p["avg_donation"], p["optin_web_1"], p["optin_web_2"])
+
+    riders = _grown(p["trenitalia_riders"] + p["italo_riders"], p["ridership_growth"], years) * weights
+    exposed = riders * p["eligible_share"][..., None] * _grown(p["digital_share"], p["digital_share_growth"], years, cap=1.0)
+    donors = exposed * _grown(optin, p["optin_growth"], years, cap=1.0)
+    net = donors * p["avg_donation"][..., None] * (1.0 - p["fee_rate"][..., None]) - p["fee_fixed"][..., None] * donors
+    return np.ravel(net.sum(axis=-1))
@@ -1,8 +1,11 @@
+from dataclasses import dataclass
 from enum import Enum
 import numpy as np
 import pandas as pd
 from pydantic import BaseModel, Field
 
+from utils.profiling import PROFILER
+
 
 class RetailMethod(str, Enum):
     TOP_DOWN = "top_down"
@@ -27,9 +30,43 @@ class RetailInputs(BaseModel):
     triangular_mode: float = 0.50
     triangular_max: float = 0.99
     payment_card_share: float = 0.7
-
-
-def simulate_roundup_distribution(inputs: RetailInputs, n: int = 10000, seed: int | None = None) -> np.ndarray:
+    # Year-on-year growth applied from the second projection year onwards
+    volume_growth: float = Field(0.0, ge=-1.0)
+    optin_growth: float = Field(0.0, ge=-1.0)
+
+    def compile(self) -> "RetailParams":
+        return RetailParams(method=self.method.value, **{name: float(getattr(self, name)) for name in _GRID_PARAMS if name != "method"})
+
+
+@dataclass(frozen=True, slots=True)
+class RetailParams:
+    # Validated RetailInputs as plain floats (method as its string value), consumed by the kernels and samplers
+    method: str
+    monthly_spend: float
+    grocery_share: float
+    avg_receipt: float
+    households: float
+    daily_receipts: float
+    stores: float
+    active_days: float
+    charm_prevalence: float
+    optin: float
+    fee_rate: float
+    fee_fixed: float
+    triangular_min: float
+    triangular_mode: float
+    triangular_max: float
+    payment_card_share: float
+    volume_growth: float
+    optin_growth: float
+
+
+def _compiled(inputs: "RetailInputs | RetailParams") -> RetailParams:
+    return inputs if isinstance(inputs, RetailParams) else inputs.compile()
+
+
+@PROFILER.timed("model.roundup_distribution")
+def simulate_roundup_distribution(inputs: RetailInputs | RetailParams, n: int = 10000, seed: int | None = None) -> np.ndarray:
     rng = np.random.default_rng(seed)
     samples = rng.triangular(inputs.triangular_min, inputs.triangular_mode, inputs.triangular_max, size=n)
     return samples * inputs.charm_prevalence
@@ -49,32 +86,112 @@ def _transactions(inputs: RetailInputs) -> int:
     return int(inputs.daily_receipts * inputs.stores * inputs.active_days)
 
 
-def compute_retail_monthly(inputs: RetailInputs, months: int = 12) -> pd.DataFrame:
-    tx = _transactions(inputs)
-    expected_round = _expected_roundup(inputs)
-    donors = tx * inputs.optin
-    gross = donors * expected_round
-    net = gross * (1.0 - inputs.fee_rate) - inputs.fee_fixed * donors
+RETAIL_METRICS = ("transactions", "donors", "gross", "net", "net_online", "net_in_store")
+_GRID_PARAMS = (
+    "method", "monthly_spend", "grocery_share", "avg_receipt", "households", "daily_receipts", "stores",
+    "active_days", "charm_prevalence", "optin", "fee_rate", "fee_fixed",
+    "triangular_min", "triangular_mode", "triangular_max", "payment_card_share",
+    "volume_growth", "optin_growth",
+)
 
-    # simple split between online and in-store using payment mix
-    online_share = inputs.payment_card_share
-    in_store_share = 1.0 - online_share
-    
-    # Scale annual values to the number of months
-    months_factor = months / 12.0
 
-    rows = []
-    for m in range(months):
-        rows.extend([
-            {"month": m + 1, "year": 1, "channel": "all", "metric": "transactions", "value": tx * months_factor / months},
-            {"month": m + 1, "year": 1, "channel": "all", "metric": "donors", "value": donors * months_factor / months},
-            {"month": m + 1, "year": 1, "channel": "all", "metric": "gross", "value": gross * months_factor / months},
-            {"month": m + 1, "year": 1, "channel": "all", "metric": "net", "value": net * months_factor / months},
-            {"month": m + 1, "year": 1, "channel": "online", "metric": "net", "value": net * months_factor / months * online_share},
-            {"month": m + 1, "year": 1, "channel": "in_store", "metric": "net", "value": net * months_factor / months * in_store_share},
-        ])
-    return pd.DataFrame(rows)
+def _transactions_grid(p: dict) -> np.ndarray:
+    # Array counterpart of _transactions; p["method"] is True for TOP_DOWN and
+    # int() truncation becomes np.trunc
+    annual_grocery = p["households"] * p["monthly_spend"] * 12.0 * p["grocery_share"]
+    top_down = np.trunc(annual_grocery / np.maximum(p["avg_receipt"], 0.01))
+    direct = np.trunc(p["daily_receipts"] * p["stores"] * p["active_days"])
+    return np.where(p["method"], top_down, direct)
+
 
+def _grid_params(base: "RetailInputs | RetailParams", params: dict) -> dict:
+    unknown = set(params) - set(_GRID_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown retail grid parameters: {sorted(unknown)}")
 
+    base = _compiled(base)
+    p = {name: np.asarray(params.get(name, getattr(base, name))) for name in _GRID_PARAMS if name != "method"}
+    # RetailMethod is a str enum, so members and plain "top_down"/"direct" strings compare equal
+    p["method"] = np.asarray(params.get("method", base.method), dtype=object) == RetailMethod.TOP_DOWN.value
+    shape = np.broadcast_shapes(*(v.shape for v in p.values()))
+    return {name: np.broadcast_to(v, shape).ravel() for name, v in p.items()}
 
 
+def _yearly_funnel(p: dict, months: int) -> tuple:
+    # (scenario, year) annual transactions, donors, gross and net; growth compounds once per projection year
+    years = np.arange(-(-months // 12))
+    tx = _transactions_grid(p)[:, None] * (1.0 + p["volume_growth"][:, None]) ** years
+    optin = np.minimum(p["optin"][:, None] * (1.0 + p["optin_growth"][:, None]) ** years, 1.0)
+
+    # Same operation order as compute_retail_monthly so single scenarios match exactly
+    expected_round = ((p["triangular_min"] + p["triangular_mode"] + p["triangular_max"]) / 3.0 * p["charm_prevalence"])[:, None]
+    donors = tx * optin
+    gross = donors * expected_round
+    net = gross * (1.0 - p["fee_rate"][:, None]) - p["fee_fixed"][:, None] * donors
+    return tx, donors, gross, net
+
+
+def _yearly_rows(p: dict, months: int) -> np.ndarray:
+    # (scenario, year, metric) monthly values
+    tx, donors, gross, net = _yearly_funnel(p, months)
+    months_factor = months / 12.0
+    monthly_net = net * months_factor / months
+    card_share = p["payment_card_share"][:, None]
+    return np.stack([
+        tx * months_factor / months,
+        donors * months_factor / months,
+        gross * months_factor / months,
+        monthly_net,
+        monthly_net * card_share,
+        monthly_net * (1.0 - card_share),
+    ], axis=-1)
+
+
+@PROFILER.timed("model.retail_grid")
+def compute_retail_grid(base: RetailInputs | RetailParams, months: int = 12, **params) -> np.ndarray:
+    """Evaluate a grid of retail scenarios in one vectorized pass.
+
+    Any RetailInputs field listed in _GRID_PARAMS can be passed as an array; arrays
+    broadcast against each other (scenarios are the flattened broadcast shape) and
+    the remaining fields come from `base`. Returns a read-only (scenario, month, metric) array ordered as RETAIL_METRICS.
+    """
+    rows = _yearly_rows(_grid_params(base, params), months)
+    n = len(rows)
+    if rows.shape[1] == 1:
+        # Annual values are spread evenly, so every month is a view of the same row
+        return np.broadcast_to(rows, (n, months, len(RETAIL_METRICS)))
+    grid = rows[:, np.arange(months) // 12]
+    grid.flags.writeable = False
+    return grid
+
+
+@PROFILER.timed("model.retail_net_totals")
+def retail_net_totals(base: RetailInputs | RetailParams, months: int = 12, **params) -> np.ndarray:
+    # Net € over the horizon per scenario without materialising the month axis or the other metrics
+    net = _yearly_funnel(_grid_params(base, params), months)[3]
+    monthly_net = net * (months / 12.0) / months
+    months_in_year = np.minimum(12, months - 12 * np.arange(net.shape[1]))
+    return (monthly_net * months_in_year).sum(axis=-1)
+
+
+def retail_grid_frame(grid: np.ndarray) -> pd.DataFrame:
+    n, months, n_metrics = grid.shape
+    return pd.DataFrame({
+        "scenario": np.repeat(np.arange(n), months * n_metrics),
+        "month": np.tile(np.repeat(np.arange(1, months + 1), n_metrics), n),
+        "metric": pd.Categorical(np.tile(RETAIL_METRICS, n * months), categories=RETAIL_METRICS),
+        "value": grid.reshape(-1),
+    })
+
+
+@PROFILER.timed("model.retail_monthly")
+def compute_retail_monthly(inputs: RetailInputs | RetailParams, months: int = 12) -> pd.DataFrame:
+    values = compute_retail_grid(inputs, months=months)[0]
+    n_metrics = len(RETAIL_METRICS)
+    return pd.DataFrame({
+        "month": np.repeat(np.arange(1, months + 1), n_metrics),
+        "year": np.repeat(np.arange(months) // 12 + 1, n_metrics),
+        "channel": np.tile(["all", "all", "all", "all", "online", "in_store"], months),
+        "metric": np.tile(["transactions", "donors", "gross", "net", "net", "net"], months),
+        "value": values.reshape(-1),
+    })
@@ -0,0 +1,117 @@
+import json
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+from models.rail import _BATCH_PARAMS, RailInputs, rail_net_totals
+from models.retail import _GRID_PARAMS, RetailInputs, RetailMethod, retail_net_totals
+
+
+def load_scenario(path) -> Dict[str, Any]:
+    # Scenario files are the assumptions dict exported by the Download tab (inputs.json)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _fees(a: Dict[str, Any]) -> tuple[float, float]:
+    # Adyen covers all fees; other processors use the default % and fixed fee
+    if a["fees"]["processor"] == "Adyen Giving":
+        return 0.0, 0.0
+    return float(a["fees"]["rate_pct"]) / 100.0, float(a["fees"]["fixed_eur"])
+
+
+def rail_inputs_from_assumptions(a: Dict[str, Any]) -> RailInputs:
+    # Mirrors the initial values of the Rail tab widgets
+    fee_rate, fee_fixed = _fees(a)
+    return RailInputs(
+        trenitalia_riders=int(a["rail"]["trenitalia_riders"]),
+        italo_riders=int(a["rail"]["italo_riders"]),
+        digital_share=int(a["rail"]["digital_share_pct"]) / 100.0,
+        eligible_share=int(a["rail"]["eligible_share_pct"]) / 100.0,
+        ask_type=a["rail"]["ask_type"],
+        choice_share_eur1=int(a["rail"]["choice_share_eur1_pct"]) / 100.0 if a["rail"]["ask_type"] == "€1 or €2 choice" else 0.7,
+        optin_web_1=int(a["rail"]["optin_web_1_pct"]) / 100.0,
+        optin_web_2=int(a["rail"]["optin_web_2_pct"]) / 100.0,
+        optin_pos=int(a["rail"]["optin_pos_pct"]) / 100.0,
+        seasonality=[float(x) for x in a["rail"]["seasonality"]],
+        fee_rate=fee_rate,
+        fee_fixed=fee_fixed,
+        processor=a["fees"]["processor"],
+        # Growth keys are optional so older inputs.json files still load
+        ridership_growth=float(a["rail"].get("ridership_growth_pct", 0)) / 100.0,
+        digital_share_growth=float(a["rail"].get("digital_share_growth_pct", 0)) / 100.0,
+        optin_growth=float(a["rail"].get("optin_growth_pct", 0)) / 100.0,
+    )
+
+
+def retail_inputs_from_assumptions(a: Dict[str, Any]) -> RetailInputs:
+    # Mirrors the initial values of the Retail tab widgets
+    fee_rate, fee_fixed = _fees(a)
+    return RetailInputs(
+        method=RetailMethod.TOP_DOWN,
+        monthly_spend=float(a["retail"]["istat_monthly_spend_2023"]),
+        grocery_share=int(a["retail"]["grocery_share_pct"]) / 100.0,
+        avg_receipt=float(a["retail"]["avg_receipt_eur"]),
+        households=int(a["retail"]["households"]),
+        daily_receipts=int(a["retail"]["daily_receipts"]),
+        stores=int(a["retail"]["stores"]),
+        active_days=int(a["retail"]["active_days"]),
+        charm_prevalence=int(a["retail"]["charm_prevalence_pct"]) / 100.0,
+        optin=int(a["retail"]["optin_pct"]) / 100.0,
+        fee_rate=fee_rate,
+        fee_fixed=fee_fixed,
+        processor=a["fees"]["processor"],
+        payment_card_share=int(a["retail"]["payment_card_share_pct"]) / 100.0,
+        volume_growth=float(a["retail"].get("volume_growth_pct", 0)) / 100.0,
+        optin_growth=float(a["retail"].get("optin_growth_pct", 0)) / 100.0,
+    )
+
+
+def scenario_paths(paths) -> list:
+    # Files are taken as given, directories contribute every *.json inside them
+    found = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            found.extend(sorted(p.rglob("*.json")))
+        else:
+            found.append(p)
+    return found
+
+
+def combine_projections(rail_df: pd.DataFrame, retail_df: pd.DataFrame) -> pd.DataFrame:
+    return pd.concat([rail_df.assign(initiative="rail"), retail_df.assign(initiative="retail")], ignore_index=True)
+
+
+def summarize_projections(monthly: pd.DataFrame) -> pd.DataFrame:
+    return monthly.groupby(["initiative", "metric"])["value"].sum().reset_index()
+
+
+def compare_scenarios(scenarios: Dict[str, Dict[str, Any]], months: int = 12) -> pd.DataFrame:
+    """Horizon totals for many assumptions dicts in one batched model pass.
+
+    Every scenario becomes one row of the rail/retail parameter arrays, so the cost
+    is a single rail_net_totals and retail_net_totals call whatever the count.
+    Totals follow the Overview tab and batch.py.
+    """
+    names = list(scenarios)
+    columns = ["scenario", "rail_net", "retail_net", "total_net", "share_of_msf_2024"]
+    if not names:
+        return pd.DataFrame(columns=columns)
+    rail = [rail_inputs_from_assumptions(a).compile() for a in scenarios.values()]
+    retail = [retail_inputs_from_assumptions(a).compile() for a in scenarios.values()]
+
+    rail_params = {name: np.array([getattr(p, name) for p in rail]) for name in _BATCH_PARAMS}
+    rail_net = rail_net_totals(rail[0], months, seasonality=np.stack([p.seasonality for p in rail]), **rail_params)
+    retail_net = retail_net_totals(retail[0], months, **{name: np.array([getattr(p, name) for p in retail]) for name in _GRID_PARAMS})
+
+    baseline = np.array([float(a["msf_italy"]["fundraising_2024_eur"]) for a in scenarios.values()])
+    total = rail_net + retail_net
+    return pd.DataFrame({
+        "scenario": names,
+        "rail_net": rail_net,
+        "retail_net": retail_net,
+        "total_net": total,
+        "share_of_msf_2024": np.divide(total, baseline, out=np.zeros_like(total), where=baseline > 0),
+    })
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.montecarlo import _rail_total_net, _retail_total_net
+from models.rail import RailInputs
+from models.retail import RetailInputs
+from utils.profiling import PROFILER
+
+
+@dataclass(frozen=True)
+class Factor:
+    name: str
+    label: str
+    low: float
+    high: float
+    # "rail", "retail" or "both" (fees apply to whichever initiatives are included)
+    target: str
+
+
+def _seasonal_horizon(months: int) -> bool:
+    # Multipliers are normalised per year and a horizon up to 12 months is renormalised over
+    # its own months, so whole years never see seasonality in the total. A trailing partial
+    # year beyond the first keeps its months' share of the year, so there it moves net €
+    return months > 12 and months % 12 != 0
+
+
+def default_factors(rail_inputs: Optional[RailInputs], retail_inputs: Optional[RetailInputs], months: int = 12) -> List[Factor]:
+    factors = []
+    if rail_inputs is not None:
+        factors += [
+            Factor("optin_web_1", "Rail opt-in €1", 0.5 * rail_inputs.optin_web_1, min(1.0, 1.5 * rail_inputs.optin_web_1), "rail"),
+            Factor("optin_web_2", "Rail opt-in €2", 0.5 * rail_inputs.optin_web_2, min(1.0, 1.5 * rail_inputs.optin_web_2), "rail"),
+            Factor("digital_share", "Rail digital share", max(0.0, rail_inputs.digital_share - 0.1), min(1.0, rail_inputs.digital_share + 0.1), "rail"),
+            Factor("eligible_share", "Rail eligible share", max(0.0, rail_inputs.eligible_share - 0.1), min(1.0, rail_inputs.eligible_share + 0.1), "rail"),
+        ]
+        if _seasonal_horizon(months):
+            # Scales the multipliers' deviations from their mean: 0 is flat, 1 the current pattern
+            factors.append(Factor("seasonality", "Rail seasonality amplitude", 0.5, 1.5, "rail"))
+    if retail_inputs is not None:
+        factors += [
+            Factor("optin", "Retail opt-in", 0.5 * retail_inputs.optin, min(1.0, 1.5 * retail_inputs.optin), "retail"),
+            Factor("charm_prevalence", "Charm pricing prevalence", 0.6, 0.9, "retail"),
+        ]
+    factors += [
+        Factor("fee_rate", "Processor % fee", 0.0, 0.03, "both"),
+        Factor("fee_fixed", "Processor fixed € fee", 0.0, 0.20, "both"),
+    ]
+    return factors
+
+
+def _evaluate(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    factors: Sequence[Factor],
+    unit: np.ndarray,
+) -> np.ndarray:
+    # unit is (n, len(factors)) in [0, 1]; every row is one model evaluation
+    rail_inputs = rail_inputs.compile() if rail_inputs is not None else None
+    retail_inputs = retail_inputs.compile() if retail_inputs is not None else None
+    values = np.array([f.low for f in factors]) + unit * np.array([f.high - f.low for f in factors])
+    total = np.zeros(len(unit))
+    if rail_inputs is not None:
+        params = {f.name: values[:, i] for i, f in enumerate(factors) if f.target in ("rail", "both")}
+        if "seasonality" in params:
+            season = np.asarray(rail_inputs.seasonality)
+            amplitude = params.pop("seasonality")[:, None]
+            params["seasonality"] = np.maximum(season.mean() + amplitude * (season - season.mean()), 0.0)
+        total += _rail_total_net(rail_inputs, months, **params)
+    if retail_inputs is not None:
+        params = {f.name: values[:, i] for i, f in enumerate(factors) if f.target in ("retail", "both")}
+        total += _retail_total_net(retail_inputs, months, **params)
+    return total
+
+
+def _sobol_estimates(f_a: np.ndarray, f_b: np.ndarray, f_ab: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # f_a, f_b are (..., n) and f_ab is (d, ..., n); returns (d, ...) first and total indices
+    var = np.concatenate([f_a, f_b], axis=-1).var(axis=-1)
+    var = np.where(var > 0, var, np.nan)
+    first = (f_b * (f_ab - f_a)).mean(axis=-1) / var
+    total = 0.5 * ((f_a - f_ab) ** 2).mean(axis=-1) / var
+    return first, total
+
+
+@PROFILER.timed("model.sobol")
+def sobol_indices(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    factors: Optional[Sequence[Factor]] = None,
+    n: int = 4096,
+    bootstrap: int = 100,
+    seed: int | None = None,
+) -> pd.DataFrame:
+    # Saltelli sampling with Saltelli (2010) first-order and Jansen total-order estimators;
+    # all n * (d + 2) evaluations run as one vectorized batch
+    from scipy.stats import qmc
+
+    factors = list(factors or default_factors(rail_inputs, retail_inputs, months))
+    d = len(factors)
+    base = qmc.Sobol(d=2 * d, scramble=True, seed=seed).random_base2(int(np.ceil(np.log2(max(n, 2)))))
+    n = len(base)
+    a, b = base[:, :d], base[:, d:]
+    ab = np.repeat(a[None, :, :], d, axis=0)
+    ab[np.arange(d), :, np.arange(d)] = b.T
+
+    f = _evaluate(rail_inputs, retail_inputs, months, factors, np.concatenate([a, b, ab.reshape(-1, d)]))
+    f_a, f_b, f_ab = f[:n], f[n:2 * n], f[2 * n:].reshape(d, n)
+    s1, st = _sobol_estimates(f_a, f_b, f_ab)
+
+    # Bootstrap replicates are rows of a (bootstrap, n) index block, estimated together
+    resample = np.random.default_rng(seed).integers(0, n, size=(bootstrap, n))
+    s1_b, st_b = _sobol_estimates(f_a[resample], f_b[resample], f_ab[:, resample])
+
+    return pd.DataFrame({
+        "factor": [f.name for f in factors],
+        "label": [f.label for f in factors],
+        "target": [f.target for f in factors],
+        "S1": s1,
+        "S1_conf": 1.96 * np.nanstd(s1_b, axis=1),
+        "ST": st,
+        "ST_conf": 1.96 * np.nanstd(st_b, axis=1),
+    })
+
+
+@PROFILER.timed("model.morris")
+def morris_effects(
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    factors: Optional[Sequence[Factor]] = None,
+    trajectories: int = 200,
+    levels: int = 4,
+    seed: int | None = None,
+) -> pd.DataFrame:
+    # One-at-a-time elementary effects on a levels-grid; all trajectory points are
+    # built up front and evaluated in one batch
+    factors = list(factors or default_factors(rail_inputs, retail_inputs, months))
+    d = len(factors)
+    rng = np.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+
+    start_levels = np.arange(levels // 2) / (levels - 1)
+    points = np.empty((trajectories, d + 1, d))
+    points[:, 0] = rng.choice(start_levels, size=(trajectories, d))
+    order = np.argsort(rng.random((trajectories, d)), axis=1)
+    rows = np.arange(trajectories)
+    for k in range(d):
+        points[:, k + 1] = points[:, k]
+        points[rows, k + 1, order[:, k]] += delta
+
+    f = _evaluate(rail_inputs, retail_inputs, months, factors, points.reshape(-1, d)).reshape(trajectories, d + 1)
+    effects = np.empty((trajectories, d))
+    effects[rows[:, None], order] = np.diff(f, axis=1) / delta
+
+    return pd.DataFrame({
+        "factor": [f.name for f in factors],
+        "label": [f.label for f in factors],
+        "target": [f.target for f in factors],
+        "mu": effects.mean(axis=0),
+        "mu_star": np.abs(effects).mean(axis=0),
+        "sigma": effects.std(axis=0, ddof=1) if trajectories > 1 else np.zeros(d),
+    })
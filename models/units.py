@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import partial
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.montecarlo import SAMPLING_MODES, _chunk_columns, _iter_chunks
+from models.rail import FUNNEL_METRICS, RailInputs, RailParams, _compiled as _compiled_rail, _effective_optin, _season_weights
+from models.retail import RETAIL_METRICS, RetailInputs, RetailParams, _compiled as _compiled_retail
+from utils.profiling import PROFILER
+
+
+# Numeric columns of a unit table: name -> (required, upper bound). Optional columns
+# (and empty cells) take the scenario value; every other column is a text label to
+# group by, e.g. route, operator, region or cluster
+UNIT_COLUMNS = {
+    "rail": {
+        "riders": (True, None),
+        "digital_share": (False, 1.0),
+        "eligible_share": (False, 1.0),
+        "optin_web_1": (False, 1.0),
+        "optin_web_2": (False, 1.0),
+    },
+    "retail": {
+        "daily_receipts": (True, None),
+        "stores": (False, None),
+        "active_days": (False, 366.0),
+        "optin": (False, 1.0),
+        "charm_prevalence": (False, 1.0),
+        "payment_card_share": (False, 1.0),
+    },
+}
+# Labels every table must have: rail splits net by operator from the routes themselves
+REQUIRED_LABELS = {"rail": ("operator",), "retail": ()}
+# Intermediate values per block of Monte Carlo iterations
+_BLOCK_ELEMENTS = 1 << 20
+
+
+@dataclass(frozen=True)
+class UnitTable:
+    # Routes (rail) or stores (retail): text labels and numeric columns as float arrays, NaN where the scenario value applies
+    kind: str
+    labels: pd.DataFrame
+    values: dict
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def resolved(self, params) -> dict:
+        # Every numeric column with empty cells filled from the scenario
+        out = {}
+        for name in UNIT_COLUMNS[self.kind]:
+            value = self.values.get(name)
+            # Required columns are always present; a row without a store count is one store
+            fill = 1.0 if name == "stores" else getattr(params, name, np.nan)
+            out[name] = np.full(len(self), float(fill)) if value is None else np.where(np.isnan(value), fill, value)
+        return out
+
+    def codes(self, by: Optional[str]) -> tuple[np.ndarray, list]:
+        # Group index of every unit and the group names in order of first appearance
+        if by is None:
+            return np.zeros(len(self), dtype=np.intp), ["all"]
+        codes, names = pd.factorize(self.labels[by], sort=False)
+        return codes, list(names)
+
+
+def read_unit_frame(source, name: Optional[str] = None) -> pd.DataFrame:
+    # CSV or Parquet by file extension; source is a path or a file-like object (an upload)
+    name = str(name if name is not None else source).lower()
+    if name.endswith(".parquet"):
+        return pd.read_parquet(source)
+    if name.endswith((".csv", ".csv.gz")):
+        return pd.read_csv(source)
+    raise ValueError(f"Unit tables must be .csv or .parquet files: {name}")
+
+
+def units_from_frame(frame: pd.DataFrame, kind: str) -> UnitTable:
+    if kind not in UNIT_COLUMNS:
+        raise ValueError(f"Unknown unit kind: {kind}")
+    columns = UNIT_COLUMNS[kind]
+    missing = [c for c, (required, _) in columns.items() if required and c not in frame] + [c for c in REQUIRED_LABELS[kind] if c not in frame]
+    if missing:
+        raise ValueError(f"Missing {kind} unit columns: {', '.join(missing)}")
+
+    values = {}
+    for name in columns:
+        if name not in frame:
+            continue
+        value = pd.to_numeric(frame[name], errors="coerce").to_numpy(dtype=float)
+        bad = (value < 0) | (value > columns[name][1] if columns[name][1] is not None else False)
+        if columns[name][0]:
+            bad |= np.isnan(value)
+        if bad.any():
+            row = int(np.argmax(bad))
+            raise ValueError(f"Invalid {name} in row {row + 1}: {frame[name].iloc[row]}")
+        values[name] = value
+    labels = frame[[c for c in frame.columns if c not in columns]].astype("string").fillna("").astype(object)
+    return UnitTable(kind=kind, labels=labels.reset_index(drop=True), values=values)
+
+
+@PROFILER.timed("model.load_units")
+def load_units(source, kind: str, name: Optional[str] = None) -> UnitTable:
+    return units_from_frame(read_unit_frame(source, name), kind)
+
+
+def _shock(ratio) -> np.ndarray:
+    # Per-iteration scale factors against the (unit, year) axes
+    return np.asarray(ratio, dtype=float)[..., None, None]
+
+
+def _rail_years(v: dict, p: RailParams, weights: np.ndarray, r1=1.0, r2=1.0, rd=1.0) -> dict:
+    # Funnel metrics per (iteration, unit, year), or per (unit, year) for scalar ratios; the
+    # same steps as rail_net_totals with the route values in place of the scenario totals
+    years = np.arange(weights.shape[-1])
+    grown = lambda g: (1.0 + g) ** years
+    riders = v["riders"][:, None] * grown(p.ridership_growth) * weights[..., None, :]
+    eligible = riders * v["eligible_share"][:, None]
+    exposed = eligible * np.minimum(v["digital_share"][:, None] * _shock(rd) * grown(p.digital_share_growth), 1.0)
+    optin = _effective_optin(p.avg_donation, v["optin_web_1"][:, None] * _shock(r1), v["optin_web_2"][:, None] * _shock(r2))
+    donors = exposed * np.minimum(optin * grown(p.optin_growth), 1.0)
+    gross = donors * p.avg_donation
+    net = gross * (1.0 - p.fee_rate) - p.fee_fixed * donors
+    return {"riders": riders, "eligible": eligible, "exposed_digital": exposed, "donors": donors, "gross": gross, "net": net}
+
+
+def _retail_years(v: dict, p: RetailParams, months: int, ro=1.0, rc=1.0) -> dict:
+    # Same for stores, following retail_net_totals for the DIRECT method: each year's
+    # annual values count for the share of the year inside the horizon
+    years = np.arange(-(-months // 12))
+    share = np.minimum(12, months - 12 * years) / 12.0
+    tx = np.trunc(v["daily_receipts"] * v["stores"] * v["active_days"])[:, None] * (1.0 + p.volume_growth) ** years
+    donors = tx * np.minimum(v["optin"][:, None] * _shock(ro) * (1.0 + p.optin_growth) ** years, 1.0)
+    expected_round = (p.triangular_min + p.triangular_mode + p.triangular_max) / 3.0 * np.minimum(v["charm_prevalence"][:, None] * _shock(rc), 1.0)
+    gross = donors * expected_round
+    net = gross * (1.0 - p.fee_rate) - p.fee_fixed * donors
+    card = v["payment_card_share"][:, None]
+    return {
+        "transactions": tx * share, "donors": donors * share, "gross": gross * share, "net": net * share,
+        "net_online": net * card * share, "net_in_store": net * (1.0 - card) * share,
+    }
+
+
+def _yearly_weights(seasonality, months: int) -> np.ndarray:
+    return np.add.reduceat(_season_weights(seasonality, months), np.arange(0, months, 12), axis=-1)
+
+
+def _forecast_frame(units: UnitTable, metrics: dict) -> pd.DataFrame:
+    return pd.concat([units.labels, pd.DataFrame({name: value.sum(axis=-1) for name, value in metrics.items()})], axis=1)
+
+
+@PROFILER.timed("model.rail_units")
+def rail_unit_forecast(units: UnitTable, inputs: RailInputs | RailParams, months: int = 12) -> pd.DataFrame:
+    """Funnel totals over the horizon for every route, in one pass over the route arrays.
+
+    Ridership comes from the routes; shares and opt-ins from their columns or, where
+    empty, the scenario. Ask, fees, seasonality and growth are the scenario's. Net is
+    counted once per route, as the Overview counts the scenario's rail net once; a table
+    with one row per operator and the scenario's riders reproduces rail_funnel.
+    """
+    p = _compiled_rail(inputs)
+    metrics = _rail_years(units.resolved(p), p, _yearly_weights(p.seasonality, months))
+    return _forecast_frame(units, {name: metrics[name] for name in FUNNEL_METRICS})
+
+
+@PROFILER.timed("model.retail_units")
+def retail_unit_forecast(units: UnitTable, inputs: RetailInputs | RetailParams, months: int = 12) -> pd.DataFrame:
+    # Per-store totals over the horizon (RETAIL_METRICS); transactions are daily_receipts x stores x active_days per row
+    p = _compiled_retail(inputs)
+    metrics = _retail_years(units.resolved(p), p, months)
+    return _forecast_frame(units, {name: metrics[name] for name in RETAIL_METRICS})
+
+
+def aggregate_units(forecast: pd.DataFrame, by: Optional[str] = None) -> pd.DataFrame:
+    # Group totals of a unit forecast plus the number of units per group
+    numeric = forecast.select_dtypes("number").columns.tolist()
+    keys = forecast[by] if by is not None else pd.Series("all", index=forecast.index, name="group")
+    out = forecast[numeric].groupby(keys, sort=False).sum()
+    out.insert(0, "units", keys.groupby(keys, sort=False).size())
+    return out.reset_index()
+
+
+def _ratio(draw: np.ndarray, base: float) -> np.ndarray:
+    # Iteration draw relative to the scenario centre; a centre of 0 leaves unit values fixed
+    return draw / base if base > 0 else np.ones_like(draw)
+
+
+@dataclass(frozen=True)
+class _CappedSums:
+    """Per-group sums of coef_u * min(rate_u * s, 1) for any scale s, without a pass over the units.
+
+    Every sum starts from the uncapped s * sum(coef * rate). Units are sorted by (group,
+    rate), so for a scale that caps some of them (rate > 1 / s) the capped units of a
+    group are the tail of its block: one searchsorted per group and differences of
+    cumulative sums give their correction.
+    """
+    key: np.ndarray
+    end: np.ndarray
+    table: np.ndarray
+    total: np.ndarray
+    peak: float
+
+    @classmethod
+    def build(cls, rate: np.ndarray, codes: np.ndarray, groups: int, coef: np.ndarray) -> "_CappedSums":
+        # Rates are shares in [0, 1], so group + rate / 2 orders by group, then rate
+        key = codes + rate * 0.5
+        order = np.argsort(key, kind="stable")
+        # (unit + 1, [coef * rate, coef], coef) cumulative sums in sorted order
+        table = np.concatenate([np.zeros((1, 2, len(coef))), np.cumsum(np.stack([coef * rate, coef], axis=1).T[order], axis=0)])
+        bounds = np.searchsorted(key[order], np.arange(groups + 1) - 0.25)
+        return cls(key[order], bounds[1:], table, table[bounds[1:]] - table[bounds[:-1]], float(rate.max(initial=0.0)))
+
+    @property
+    def groups(self) -> int:
+        return len(self.end)
+
+    def __call__(self, s: np.ndarray) -> np.ndarray:
+        # (*s.shape, group, coef)
+        out = s[..., None, None] * self.total[:, 0]
+        hit = s * self.peak > 1.0
+        if hit.any():
+            scale = s[hit]
+            pos = np.searchsorted(self.key, np.arange(self.groups) + np.minimum(1.0 / scale, 1.0)[:, None] * 0.5, side="right")
+            capped = self.table[self.end] - self.table[pos]
+            out[hit] += capped[..., 1, :] - scale[:, None, None] * capped[..., 0, :]
+        return out
+
+
+@dataclass(frozen=True)
+class _UnitPlan:
+    # What one initiative's Monte Carlo needs per chunk: capped group sums of the unit
+    # terms net € is linear in, the largest opt-ins (iterations that could push an
+    # opt-in past 1 take the exact path) and the unit arrays for that path
+    values: dict
+    codes: np.ndarray
+    sums: _CappedSums
+    peaks: dict
+
+    @property
+    def groups(self) -> int:
+        return self.sums.groups
+
+
+def _rail_plan(units: UnitTable, p: RailParams, by: Optional[str]) -> _UnitPlan:
+    # Terms of riders x eligible x min(digital, 1) x blended opt-in, capped on the digital share
+    v = units.resolved(p)
+    codes, names = units.codes(by)
+    a, b = _effective_optin(p.avg_donation, 1.0, 0.0), _effective_optin(p.avg_donation, 0.0, 1.0)
+    base = v["riders"] * v["eligible_share"]
+    sums = _CappedSums.build(v["digital_share"], codes, len(names), np.stack([base * a * v["optin_web_1"], base * b * v["optin_web_2"]]))
+    peaks = {name: float(v[name].max(initial=0.0)) for name in ("optin_web_1", "optin_web_2")}
+    return _UnitPlan(v, codes, sums, peaks)
+
+
+def _retail_plan(units: UnitTable, p: RetailParams, by: Optional[str]) -> _UnitPlan:
+    # Terms of transactions x opt-in x min(charm prevalence, 1), capped on the charm prevalence
+    v = units.resolved(p)
+    codes, names = units.codes(by)
+    opted = np.trunc(v["daily_receipts"] * v["stores"] * v["active_days"]) * v["optin"]
+    sums = _CappedSums.build(v["charm_prevalence"], codes, len(names), opted[None])
+    return _UnitPlan(v, codes, sums, {"optin": float(v["optin"].max(initial=0.0))})
+
+
+def _group_sum(values: np.ndarray, codes: np.ndarray, groups: int) -> np.ndarray:
+    # (iteration, unit) -> (iteration, group) through one sparse indicator product
+    from scipy.sparse import csr_matrix
+
+    indicator = csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)), shape=(len(codes), groups))
+    return np.asarray((indicator.T @ values.T).T)
+
+
+def _blocks(n: int, width: int) -> Iterator[slice]:
+    # Iteration blocks of about _BLOCK_ELEMENTS intermediate values
+    step = max(1, _BLOCK_ELEMENTS // max(width, 1))
+    return (slice(start, start + step) for start in range(0, n, step))
+
+
+def _exact(plan: _UnitPlan, net: np.ndarray, capped: np.ndarray, years: int, evaluate) -> None:
+    # Overwrite the given iterations with group sums of the full unit funnel
+    rows = np.flatnonzero(capped)
+    for block in _blocks(len(rows), len(plan.codes) * years):
+        net[rows[block]] = _group_sum(evaluate(rows[block]).sum(axis=-1), plan.codes, plan.groups)
+
+
+def _rail_chunk_net(plan: _UnitPlan, p: RailParams, draws: dict, months: int) -> np.ndarray:
+    # Every iteration scales the shares of all routes by the same ratio, so group net is
+    # the capped digital-share sums at that ratio times per-iteration factors. Opt-ins
+    # are only capped in iterations that could push one past 1, which use the route arrays
+    r1, r2 = _ratio(draws["rail_optin_web_1"], p.optin_web_1), _ratio(draws["rail_optin_web_2"], p.optin_web_2)
+    rd = _ratio(draws["rail_digital_share"], p.digital_share)
+    weights = _yearly_weights(draws["rail_seasonality"], months)
+    years = np.arange(weights.shape[-1])
+    digital_growth, optin_growth = (1.0 + p.digital_share_growth) ** years, (1.0 + p.optin_growth) ** years
+    per_donor = p.avg_donation * (1.0 - p.fee_rate) - p.fee_fixed
+    # (iteration, year) factor outside the unit sums
+    factor = per_donor * weights * (1.0 + p.ridership_growth) ** years * optin_growth
+
+    if p.digital_share_growth == 0:
+        # Same digital-share scale in every year
+        factor, digital_growth = factor.sum(axis=1, keepdims=True), digital_growth[:1]
+    ratios = np.column_stack([r1, r2])
+
+    net = np.empty((len(rd), plan.groups))
+    for block in _blocks(len(rd), 4 * len(digital_growth) * plan.groups):
+        net[block] = np.einsum("iy,iygk,ik->ig", factor[block], plan.sums(rd[block, None] * digital_growth), ratios[block])
+
+    a, b = _effective_optin(p.avg_donation, 1.0, 0.0), _effective_optin(p.avg_donation, 0.0, 1.0)
+    capped = (a * plan.peaks["optin_web_1"] * r1 + b * plan.peaks["optin_web_2"] * r2) * optin_growth.max() > 1.0
+    _exact(plan, net, capped, len(years), lambda i: _rail_years(plan.values, p, weights[i], r1[i], r2[i], rd[i])["net"])
+    return net
+
+
+def _retail_chunk_net(plan: _UnitPlan, p: RetailParams, draws: dict, months: int) -> np.ndarray:
+    # Same for stores: net is linear in transactions x opt-in, and gross also in the capped charm prevalence
+    ro, rc = _ratio(draws["retail_optin"], p.optin), _ratio(draws["retail_charm_prevalence"], p.charm_prevalence)
+    years = np.arange(-(-months // 12))
+    optin_growth = (1.0 + p.optin_growth) ** years
+    share = np.minimum(12, months - 12 * years) / 12.0
+    factor = (share @ ((1.0 + p.volume_growth) ** years * optin_growth)) * ro
+    per_round = (p.triangular_min + p.triangular_mode + p.triangular_max) / 3.0 * (1.0 - p.fee_rate)
+    opted = plan.sums.total[:, 1, 0]
+
+    net = np.empty((len(ro), plan.groups))
+    for block in _blocks(len(ro), 2 * plan.groups):
+        net[block] = factor[block, None] * (per_round * plan.sums(rc[block])[..., 0] - p.fee_fixed * opted)
+
+    capped = plan.peaks["optin"] * ro * optin_growth.max() > 1.0
+    _exact(plan, net, capped, len(years), lambda i: _retail_years(plan.values, p, months, ro[i], rc[i])["net"])
+    return net
+
+
+def _unit_chunk(
+    rail_plan: Optional[_UnitPlan], retail_plan: Optional[_UnitPlan],
+    rail: Optional[RailParams], retail: Optional[RetailParams], months: int, size: int,
+    seed_seq: np.random.SeedSequence, sampling: str = "random",
+) -> np.ndarray:
+    # (iteration, rail groups + retail groups) net for one chunk; the draws are those of
+    # run_monte_carlo for the same scenario, seed and sampling mode
+    draws = _chunk_columns(rail, retail, months, size, seed_seq, sampling)
+    blocks = []
+    if rail_plan is not None:
+        blocks.append(_rail_chunk_net(rail_plan, rail, draws, months))
+    if retail_plan is not None:
+        blocks.append(_retail_chunk_net(retail_plan, retail, draws, months))
+    return np.hstack(blocks)
+
+
+@PROFILER.timed("model.unit_monte_carlo")
+def unit_monte_carlo(
+    routes: Optional[UnitTable],
+    stores: Optional[UnitTable],
+    rail_inputs: Optional[RailInputs],
+    retail_inputs: Optional[RetailInputs],
+    months: int,
+    rail_by: Optional[str] = "operator",
+    retail_by: Optional[str] = None,
+    iterations: int = 2000,
+    seed: int | None = None,
+    workers: int | None = 1,
+    sampling: str = "random",
+) -> pd.DataFrame:
+    """Monte Carlo of net € per route and store group, with the draws of run_monte_carlo.
+
+    Each iteration moves the opt-ins, digital share, charm prevalence and seasonality of
+    every unit together: a unit's value is scaled by the iteration draw over the scenario
+    value. Columns are "rail.<group>" and "retail.<group>" (groups of `rail_by` and
+    `retail_by`, or "all"), then rail_net, retail_net and total_net. Cost grows with
+    iterations x groups, not with the number of units.
+    """
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    rail = rail_inputs.compile() if routes is not None and len(routes) and rail_inputs is not None else None
+    retail = retail_inputs.compile() if stores is not None and len(stores) and retail_inputs is not None else None
+    if rail is None and retail is None:
+        return pd.DataFrame({"total_net": []})
+
+    rail_plan = _rail_plan(routes, rail, rail_by) if rail is not None else None
+    retail_plan = _retail_plan(stores, retail, retail_by) if retail is not None else None
+    fn = partial(_unit_chunk, rail_plan, retail_plan)
+    net = np.vstack(list(_iter_chunks(fn, rail, retail, months, iterations, seed, workers, sampling)))
+
+    columns, start = {}, 0
+    for prefix, plan, units, by in (("rail", rail_plan, routes, rail_by), ("retail", retail_plan, stores, retail_by)):
+        total = np.zeros(len(net))
+        if plan is not None:
+            for i, name in enumerate(units.codes(by)[1]):
+                columns[f"{prefix}.{name}"] = net[:, start + i]
+            total = net[:, start:start + plan.groups].sum(axis=1)
+            start += plan.groups
+        columns[f"{prefix}_net"] = total
+    columns["total_net"] = columns["rail_net"] + columns["retail_net"]
+    return pd.DataFrame(columns)
+
+
+# Regions and store formats of the sample tables
+_REGIONS = (
+    "Lombardia", "Lazio", "Campania", "Sicilia", "Veneto", "Emilia-Romagna", "Piemonte", "Puglia", "Toscana",
+    "Calabria", "Sardegna", "Liguria", "Marche", "Abruzzo", "Friuli-Venezia Giulia", "Trentino-Alto Adige",
+    "Umbria", "Basilicata", "Molise", "Valle d'Aosta",
+)
+_CLUSTERS = {"hypermarket": (2.5, 0.85), "supermarket": (1.0, 0.75), "express": (0.45, 0.6)}
+
+
+def sample_rail_routes(inputs: RailInputs | RailParams, n: int = 10_000, seed: int | None = 0) -> pd.DataFrame:
+    # Synthetic route table whose riders add up to each operator's scenario riders; long-distance
+    # routes sell more tickets online than regional ones. A template for real partner data
+    p = _compiled_rail(inputs)
+    rng = np.random.default_rng(seed)
+    total = p.trenitalia_riders + p.italo_riders
+    operator = np.where(rng.random(n) < (p.italo_riders / total if total else 0.0), "Italo", "Trenitalia")
+    long_distance = (operator == "Italo") | (rng.random(n) < 0.2)
+    riders = rng.lognormal(0.0, 1.0, n)
+    for name, count in (("Trenitalia", p.trenitalia_riders), ("Italo", p.italo_riders)):
+        mask = operator == name
+        riders[mask] *= count / max(riders[mask].sum(), 1e-12)
+    digital = np.clip(p.digital_share + np.where(long_distance, 0.2, -0.05) + rng.normal(0, 0.05, n), 0.05, 0.99)
+    return pd.DataFrame({
+        "route": [f"R{i:05d}" for i in range(n)],
+        "operator": operator,
+        "segment": np.where(long_distance, "long_distance", "regional"),
+        "region": rng.choice(_REGIONS, n),
+        "riders": np.rint(riders),
+        "digital_share": digital.round(3),
+    })
+
+
+def sample_retail_stores(inputs: RetailInputs | RetailParams, n: int = 20_000, seed: int | None = 0) -> pd.DataFrame:
+    # Synthetic store table around the scenario's daily receipts and card share, by store format
+    p = _compiled_retail(inputs)
+    rng = np.random.default_rng(seed)
+    cluster = rng.choice(list(_CLUSTERS), n, p=[0.1, 0.5, 0.4])
+    size, card = (np.array([_CLUSTERS[c][i] for c in cluster]) for i in range(2))
+    return pd.DataFrame({
+        "store": [f"S{i:05d}" for i in range(n)],
+        "cluster": cluster,
+        "region": rng.choice(_REGIONS, n),
+        "daily_receipts": np.rint(p.daily_receipts * size * rng.lognormal(0.0, 0.3, n)),
+        "payment_card_share": np.clip(card + (p.payment_card_share - 0.7) + rng.normal(0, 0.05, n), 0.0, 1.0).round(3),
+    })
@@ -0,0 +1,292 @@
+"""Multi-page PDF report for one scenario.
+
+Figures are rendered to PNG with kaleido in a process pool (every export drives a
+headless browser, which is slow, so figures render side by side) and assembled
+into an A4 document with reportlab. PNGs are cached by a hash of the figure and
+finished reports by a hash of the scenario, so repeat downloads are instant.
+REPORT_JOBS builds reports on a background thread so the Streamlit script never
+waits for one. No Streamlit import anywhere on this path.
+"""
+
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from models.montecarlo import run_monte_carlo
+from models.rail import RailInputs, rail_funnel
+from models.retail import RetailInputs, compute_retail_monthly
+from utils.cache import input_hash
+from utils.charts import binned_histogram, histogram_counts, stacked_bar_overview
+from utils.formatting import euro, pct
+from utils.profiling import PROFILER
+
+
+REPORT_CACHE = Path(os.environ.get("MSF_REPORT_CACHE", ".report_cache"))
+MAX_REPORTS = 50
+FIGURE_WIDTH, FIGURE_HEIGHT, FIGURE_SCALE = 1000, 520, 2
+
+
+@dataclass(frozen=True)
+class ReportFigure:
+    title: str
+    figure: Any
+    # Data behind the chart, printed instead when the figure cannot be rendered
+    table: pd.DataFrame
+
+
+def report_key(
+    rail_inputs: RailInputs, retail_inputs: RetailInputs, months: int, msf_baseline: float,
+    mc_iterations: int = 8192, seed: int = 123,
+) -> str:
+    return input_hash("report", rail_inputs, retail_inputs, months, msf_baseline, mc_iterations, seed)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Readers never see a partly written file; concurrent writers produce identical bytes
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".tmp-{uuid.uuid4().hex}")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _prune(directory: Path, keep: int) -> None:
+    # Least recently used files go first
+    files = sorted(directory.glob("*.pdf"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in files[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def cached_report(key: str, cache_dir: Path = REPORT_CACHE) -> Optional[bytes]:
+    path = cache_dir / "reports" / f"{key}.pdf"
+    try:
+        data = path.read_bytes()
+        os.utime(path)
+    except OSError:
+        return None
+    return data
+
+
+def report_figures(
+    rail_inputs: RailInputs, retail_inputs: RetailInputs, months: int, msf_baseline: float,
+    mc_iterations: int = 8192, seed: int = 123,
+) -> tuple[Dict[str, float], Dict[str, ReportFigure]]:
+    # Headline numbers and the report's figures, built from the same model calls as the tabs
+    import plotly.express as px
+
+    funnel = rail_funnel(rail_inputs, months=months)
+    retail = compute_retail_monthly(retail_inputs, months=months)
+    retail_all = retail[retail["channel"] == "all"]
+    rail_net = float(funnel.net.sum())
+    retail_net = float(retail_all.loc[retail_all["metric"] == "net", "value"].sum())
+    totals = run_monte_carlo(rail_inputs, retail_inputs, months, iterations=mc_iterations, seed=seed, sampling="sobol")["total_net"]
+    p5, p50, p95 = np.percentile(totals, [5, 50, 95])
+    summary = {"rail_net": rail_net, "retail_net": retail_net, "total_net": rail_net + retail_net,
+               "msf_baseline": msf_baseline, "p5": p5, "p50": p50, "p95": p95}
+
+    figures = {}
+    overview = pd.DataFrame({"category": ["Rail", "Retail", "MSF 2024"], "value": [rail_net, retail_net, msf_baseline]})
+    figures["overview"] = ReportFigure("Net € against MSF Italy 2024 fundraising", stacked_bar_overview(rail_net, retail_net, msf_baseline), overview)
+
+    rail_cols = ["riders", "eligible", "exposed_digital", "donors", "net"]
+    rail_stages = pd.DataFrame({"metric": rail_cols, "value": [getattr(funnel, metric).sum() for metric in rail_cols]})
+    figures["rail_funnel"] = ReportFigure("Rail funnel", px.funnel(rail_stages, y="metric", x="value", title="Rail funnel"), rail_stages)
+
+    retail_cols = ["transactions", "donors", "gross", "net"]
+    retail_stages = retail_all.groupby("metric")["value"].sum().reindex(retail_cols).reset_index()
+    figures["retail_funnel"] = ReportFigure("Retail funnel", px.funnel(retail_stages, y="metric", x="value", title="Retail funnel"), retail_stages)
+
+    monthly = pd.DataFrame({
+        "month": np.arange(1, months + 1),
+        "rail": funnel.net,
+        "retail": retail_all.loc[retail_all["metric"] == "net", "value"].to_numpy(),
+    })
+    fig_monthly = px.line(monthly, x="month", y=["rail", "retail"], title="Monthly net € with seasonality", labels={"value": "net €", "variable": "initiative"})
+    figures["seasonality"] = ReportFigure("Monthly net € with seasonality", fig_monthly, monthly)
+
+    channels = pd.concat([
+        pd.DataFrame({"initiative": "Rail", "channel": list(funnel.operator_net()), "value": list(funnel.operator_net().values())}),
+        retail[(retail["metric"] == "net") & (retail["channel"] != "all")].groupby("channel")["value"].sum()
+        .reset_index().assign(initiative="Retail"),
+    ], ignore_index=True)[["initiative", "channel", "value"]]
+    fig_channels = px.bar(channels, x="channel", y="value", color="initiative", title="Net € by operator and channel", labels={"value": "net €"})
+    figures["channels"] = ReportFigure("Net € by operator and channel", fig_channels, channels)
+
+    edges, counts = histogram_counts(totals, 60)
+    fig_mc = binned_histogram(edges, counts, "Monte Carlo distribution of total net €", "total_net", quantiles={"P5": p5, "P50": p50, "P95": p95})
+    bands = pd.DataFrame({"percentile": ["P5", "P50", "P95"], "value": [p5, p50, p95]})
+    figures["monte_carlo"] = ReportFigure(f"Monte Carlo ({mc_iterations:,} scrambled Sobol iterations)", fig_mc, bands)
+    return summary, figures
+
+
+def _render_png(spec: str) -> Optional[bytes]:
+    # Module-level so pool workers can unpickle it; None when kaleido or its browser is unavailable
+    import plotly.io as pio
+
+    try:
+        return pio.from_json(spec).to_image(format="png", width=FIGURE_WIDTH, height=FIGURE_HEIGHT, scale=FIGURE_SCALE)
+    except Exception:
+        return None
+
+
+@PROFILER.timed("export.report_figures")
+def render_figures(figures: Dict[str, Any], workers: Optional[int] = None, cache_dir: Path = REPORT_CACHE) -> Dict[str, Optional[bytes]]:
+    # PNG per figure, keyed by a hash of the figure JSON so unchanged charts are never re-rendered
+    specs = {name: fig.to_json() for name, fig in figures.items()}
+    paths = {name: cache_dir / "figures" / f"{hashlib.sha256(spec.encode('utf-8')).hexdigest()}.png" for name, spec in specs.items()}
+    out = {name: path.read_bytes() for name, path in paths.items() if path.exists()}
+    missing = [name for name in figures if name not in out]
+    if missing and importlib.util.find_spec("kaleido") is not None:
+        workers = min(workers or os.cpu_count() or 1, len(missing))
+        if workers <= 1:
+            images = [_render_png(specs[name]) for name in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                images = list(pool.map(_render_png, [specs[name] for name in missing]))
+        for name, png in zip(missing, images):
+            out[name] = png
+            if png is not None:
+                _write_atomic(paths[name], png)
+    return {name: out.get(name) for name in figures}
+
+
+def _number(value) -> str:
+    return f"{value:,.0f}" if isinstance(value, (int, float, np.integer, np.floating)) else str(value)
+
+
+def _assemble(
+    summary: Dict[str, float], figures: Dict[str, ReportFigure], images: Dict[str, Optional[bytes]],
+    rail_inputs: RailInputs, retail_inputs: RetailInputs, months: int, key: str,
+) -> bytes:
+    # reportlab is only imported once a report is built
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Image, KeepTogether, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    grid = TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
+        ("FONTSIZE", (0, 0), (-1, -1), 9),
+        ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+    ])
+    width = A4[0] - 4 * cm
+
+    def table(rows) -> Table:
+        t = Table(rows, hAlign="LEFT")
+        t.setStyle(grid)
+        return t
+
+    def figure(item: ReportFigure, png: Optional[bytes]) -> list:
+        body = [Paragraph(item.title, styles["Heading2"])]
+        if png is None:
+            body.append(Paragraph("Chart not rendered (kaleido and a Chrome browser are needed); data:", styles["Italic"]))
+            body.append(table([list(item.table.columns)] + [[_number(v) for v in row] for row in item.table.itertuples(index=False)]))
+        else:
+            body.append(Image(io.BytesIO(png), width=width, height=width * FIGURE_HEIGHT / FIGURE_WIDTH))
+        return [KeepTogether(body), Spacer(1, 0.6 * cm)]
+
+    def footer(canvas, doc) -> None:
+        canvas.setFont("Helvetica", 8)
+        canvas.drawString(2 * cm, 1.2 * cm, f"MSF Micro-donations Simulator · scenario {key[:12]}")
+        canvas.drawRightString(A4[0] - 2 * cm, 1.2 * cm, f"Page {doc.page}")
+
+    share = summary["total_net"] / summary["msf_baseline"] if summary["msf_baseline"] > 0 else 0.0
+    story = [
+        Paragraph("MSF Micro-donations Simulator – Scenario report", styles["Title"]),
+        Paragraph(f"{months}-month horizon · generated {datetime.now():%Y-%m-%d %H:%M}", styles["Normal"]),
+        Spacer(1, 0.5 * cm),
+        table([
+            ["Metric", "Value"],
+            ["Rail net €", euro(summary["rail_net"])],
+            ["Retail net €", euro(summary["retail_net"])],
+            ["Total net €", euro(summary["total_net"])],
+            ["% of MSF Italy fundraising 2024", pct(share)],
+            ["Monte Carlo 5th / 50th / 95th %", " / ".join(euro(summary[k]) for k in ("p5", "p50", "p95"))],
+        ]),
+        Spacer(1, 0.6 * cm),
+        *figure(figures["overview"], images["overview"]),
+        PageBreak(),
+    ]
+    for name in ("rail_funnel", "retail_funnel", "seasonality", "channels", "monte_carlo"):
+        story += figure(figures[name], images[name])
+    story += [PageBreak(), Paragraph("Assumptions", styles["Heading1"])]
+    for title, inputs in (("Rail", rail_inputs), ("Retail", retail_inputs)):
+        rows = [["Input", "Value"]] + [
+            [name, ", ".join(f"{v:g}" for v in value) if isinstance(value, (list, tuple)) else str(value)]
+            for name, value in inputs.model_dump(mode="json").items()
+        ]
+        story += [Paragraph(title, styles["Heading2"]), table(rows), Spacer(1, 0.4 * cm)]
+
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+                            title="MSF Micro-donations Simulator – Scenario report")
+    doc.build(story, onFirstPage=footer, onLaterPages=footer)
+    return buf.getvalue()
+
+
+@PROFILER.timed("export.report")
+def build_report(
+    rail_inputs: RailInputs, retail_inputs: RetailInputs, months: int, msf_baseline: float,
+    mc_iterations: int = 8192, seed: int = 123, workers: Optional[int] = None, cache_dir: Path = REPORT_CACHE,
+) -> bytes:
+    key = report_key(rail_inputs, retail_inputs, months, msf_baseline, mc_iterations, seed)
+    pdf = cached_report(key, cache_dir)
+    if pdf is not None:
+        return pdf
+    summary, figures = report_figures(rail_inputs, retail_inputs, months, msf_baseline, mc_iterations, seed)
+    images = render_figures({name: item.figure for name, item in figures.items()}, workers, cache_dir)
+    pdf = _assemble(summary, figures, images, rail_inputs, retail_inputs, months, key)
+    # Reports with table fallbacks stay out of the disk cache, so they are redone once charts can render
+    if all(png is not None for png in images.values()):
+        _write_atomic(cache_dir / "reports" / f"{key}.pdf", pdf)
+        _prune(cache_dir / "reports", MAX_REPORTS)
+    return pdf
+
+
+class ReportJobs:
+    """Report builds on one background thread, at most one job per report key.
+
+    Finished jobs are kept (most recent max_jobs), so a report built in this process
+    can be downloaded again without a rebuild even when it is not on disk.
+    """
+
+    def __init__(self, max_jobs: int = 16):
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, Future] = OrderedDict()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or (job.done() and job.exception() is not None):
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+                job = self._executor.submit(fn, *args, **kwargs)
+                self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            for old in list(self._jobs)[:-self.max_jobs]:
+                if self._jobs[old].done():
+                    del self._jobs[old]
+            return job
+
+    def get(self, key: str) -> Optional[Future]:
+        with self._lock:
+            return self._jobs.get(key)
+
+
+REPORT_JOBS = ReportJobs()
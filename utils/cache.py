@@ -0,0 +1,77 @@
+import hashlib
+import json
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Callable
+
+import numpy as np
+from pydantic import BaseModel
+
+
+def _jsonable(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot hash object of type {type(obj).__name__}")
+
+
+def input_hash(*parts: Any) -> str:
+    # Stable across reruns and processes: pydantic inputs are hashed by their JSON dump
+    payload = json.dumps(parts, default=_jsonable, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ModelCache:
+    """Bounded LRU cache for model outputs, keyed on a hash of the inputs.
+
+    Cached values are shared between reruns and sessions, so callers must treat
+    them as read-only.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def call(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        name = fn.__name__
+        key = input_hash(name, args, kwargs)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits[name] += 1
+                return self._data[key]
+            self.misses[name] += 1
+
+        # Compute outside the lock so one slow Monte Carlo run does not block other sessions
+        value = fn(*args, **kwargs)
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "functions": {name: {"hits": self.hits[name], "misses": self.misses[name]} for name in names},
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+
+# Lives in an imported module so it survives Streamlit reruns of app.py
+MODEL_CACHE = ModelCache(maxsize=64)
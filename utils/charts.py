@@ -1,8 +1,12 @@
+from typing import Dict, Optional
+
+import numpy as np
 import pandas as pd
-import plotly.express as px
 
 
 def stacked_bar_overview(rail: float, retail: float, baseline: float):
+    import plotly.express as px
+
     df = pd.DataFrame({
         "category": ["Rail", "Retail", "MSF 2024"],
         "value": [rail, retail, baseline],
@@ -12,5 +16,22 @@ def stacked_bar_overview(rail: float, retail: float, baseline: float):
     return fig
 
 
+def histogram_counts(samples, bins: int = 60) -> tuple[np.ndarray, np.ndarray]:
+    # (edges, counts) binned on the server; same order as the streaming/stored histograms
+    counts, edges = np.histogram(np.asarray(samples), bins=bins)
+    return edges, counts
 
 
+def binned_histogram(
+    edges, counts, title: str, x_label: str, y_label: str = "count", quantiles: Optional[Dict[str, float]] = None,
+):
+    # Bars span their bins, so the figure carries one point per bin whatever the sample
+    # count; quantiles are drawn as labelled vertical lines
+    import plotly.graph_objects as go
+
+    edges = np.asarray(edges, dtype=float)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges)))
+    for label, value in (quantiles or {}).items():
+        fig.add_vline(x=float(value), line_dash="dash", annotation_text=label)
+    fig.update_layout(title=title, bargap=0, xaxis_title=x_label, yaxis_title=y_label)
+    return fig
@@ -0,0 +1,129 @@
+import io
+import tempfile
+from typing import IO, Dict, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+# format -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow"),
+}
+# Repeated string labels of the long projection layout
+LABEL_COLUMNS = ("initiative", "operator", "channel", "metric")
+ROW_GROUP_ROWS = 250_000
+# Exports up to this size stay in memory; larger ones spill to a temporary file
+SPOOL_BYTES = 64 * 1024 * 1024
+
+
+def _compact(frame: pd.DataFrame, float32: bool, categories: Dict[str, list]) -> pd.DataFrame:
+    # Labels become dictionary-encoded categoricals with fixed categories, so every row
+    # group shares one dictionary; integers are int32 and floats optionally float32
+    out = {}
+    for name, col in frame.items():
+        if name in categories:
+            out[name] = pd.Categorical(col, categories=categories[name])
+        elif pd.api.types.is_integer_dtype(col) or pd.api.types.is_bool_dtype(col):
+            out[name] = col.to_numpy(dtype=np.int32) if pd.api.types.is_integer_dtype(col) else col.to_numpy()
+        elif pd.api.types.is_float_dtype(col):
+            out[name] = col.to_numpy(dtype=np.float32 if float32 else np.float64)
+        else:
+            out[name] = col
+    return pd.DataFrame(out)
+
+
+def label_categories(frame: pd.DataFrame) -> Dict[str, list]:
+    # Categories of every label column present, in order of first appearance
+    return {name: list(pd.unique(frame[name].dropna())) for name in LABEL_COLUMNS if name in frame}
+
+
+def wide_projections(monthly: pd.DataFrame) -> pd.DataFrame:
+    """One row per (month, year) and one column per series of the long layout.
+
+    Series are named by their labels joined with dots, e.g. "rail.all.digital.net"
+    or "retail.online.net"; the operator split rows of rail have month 0.
+    """
+    labels = [name for name in LABEL_COLUMNS if name in monthly]
+    series = monthly[labels].astype("string").fillna("").agg(".".join, axis=1).str.replace(r"\.{2,}", ".", regex=True).str.strip(".")
+    wide = monthly.assign(series=series).pivot_table(index=["month", "year"], columns="series", values="value", aggfunc="sum", sort=False)
+    wide = wide.sort_index()
+    wide.columns.name = None
+    return wide.reset_index()
+
+
+def write_frames(
+    frames: Iterable[pd.DataFrame], sink: IO[bytes], fmt: str = "parquet", float32: bool = False,
+    categories: Optional[Dict[str, list]] = None,
+) -> None:
+    """Write a sequence of same-schema frames to a binary sink, one row group (or record batch) per frame.
+
+    Only one frame is converted at a time, so memory follows the frame size rather than
+    the export size. `categories` fixes the label dictionaries; Arrow IPC files need the
+    same dictionary in every batch.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    categories = categories or {}
+    if fmt == "csv":
+        for i, frame in enumerate(frames):
+            sink.write(frame.to_csv(index=False, header=i == 0).encode("utf-8"))
+        return
+
+    # pyarrow is only imported once a columnar export is requested
+    import pyarrow as pa
+
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(_compact(frame, float32, categories), preserve_index=False)
+            if writer is None:
+                if fmt == "parquet":
+                    import pyarrow.parquet as pq
+
+                    writer = pq.ParquetWriter(sink, table.schema, compression="zstd")
+                else:
+                    writer = pa.ipc.new_file(sink, table.schema)
+            if fmt == "parquet":
+                writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+            else:
+                writer.write_table(table, max_chunksize=ROW_GROUP_ROWS)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def frame_blocks(frame: pd.DataFrame, block: int = ROW_GROUP_ROWS) -> Iterator[pd.DataFrame]:
+    for start in range(0, max(len(frame), 1), block):
+        yield frame.iloc[start:start + block]
+
+
+def export_frame(frame: pd.DataFrame, fmt: str = "parquet", float32: bool = False, block: int = ROW_GROUP_ROWS) -> IO[bytes]:
+    # Rewound file-like export of an in-memory frame, written block by block
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    write_frames(frame_blocks(frame, block), out, fmt, float32, label_categories(frame))
+    out.seek(0)
+    return out
+
+
+def export_run(run, columns: Optional[Sequence[str]] = None, fmt: str = "parquet", float32: bool = False, block: int = ROW_GROUP_ROWS) -> IO[bytes]:
+    # Same for a StoredRun: rows are copied from the memory-mapped columns one block at a time
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    write_frames((run.frame(columns, start, start + block) for start in range(0, max(len(run), 1), block)), out, fmt, float32)
+    out.seek(0)
+    return out
+
+
+def read_export(data: bytes, fmt: str) -> pd.DataFrame:
+    # Inverse of the writers, for checks and notebooks
+    if fmt == "csv":
+        return pd.read_csv(io.BytesIO(data))
+    import pyarrow as pa
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+    return pa.ipc.open_file(pa.BufferReader(data)).read_all().to_pandas()
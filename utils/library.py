@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+import pandas as pd
+
+from utils.cache import input_hash
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    input_hash TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    assumptions TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scenarios_input_hash ON scenarios (input_hash);
+CREATE TABLE IF NOT EXISTS scenario_tags (
+    tag TEXT NOT NULL COLLATE NOCASE,
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, scenario_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scenario_tags_scenario ON scenario_tags (scenario_id);
+"""
+
+# Stay below SQLite's bound-parameter limit on older builds
+_IN_BATCH = 500
+
+
+def scenario_hash(assumptions: Dict[str, Any]) -> str:
+    return input_hash("scenario", assumptions)
+
+
+def parse_tags(text: str) -> list:
+    # "pilot, rail ,Q3" -> ["pilot", "rail", "Q3"]
+    return list(dict.fromkeys(t.strip() for t in text.split(",") if t.strip()))
+
+
+class ScenarioLibrary:
+    """Saved assumptions dicts (the inputs.json payload) in a local SQLite file.
+
+    Names are unique (case-insensitive); tags and the input hash are indexed so
+    searches and duplicate checks do not scan the stored JSON. A connection is
+    opened per call, which keeps the library safe to share between sessions.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._ready = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            conn.execute("PRAGMA foreign_keys = ON")
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                self._ready = True
+            with conn:
+                yield conn
+
+    def save(self, name: str, assumptions: Dict[str, Any], tags: Iterable[str] = ()) -> str:
+        # Saving under an existing name replaces that scenario and its tags
+        return self.save_many([(name, assumptions, tags)])[0]
+
+    def save_many(self, items: Iterable[tuple]) -> list:
+        # (name, assumptions, tags) triples written in one transaction; returns the input hashes
+        keys = []
+        now = time.time()
+        with self._connect() as conn:
+            for name, assumptions, tags in items:
+                name = name.strip()
+                if not name:
+                    raise ValueError("Scenario name must not be empty")
+                key = scenario_hash(assumptions)
+                conn.execute(
+                    "INSERT INTO scenarios (name, input_hash, created, updated, assumptions) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET input_hash = excluded.input_hash, updated = excluded.updated, "
+                    "assumptions = excluded.assumptions",
+                    (name, key, now, now, json.dumps(assumptions, separators=(",", ":"))),
+                )
+                (scenario_id,) = conn.execute("SELECT id FROM scenarios WHERE name = ?", (name,)).fetchone()
+                conn.execute("DELETE FROM scenario_tags WHERE scenario_id = ?", (scenario_id,))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO scenario_tags (tag, scenario_id) VALUES (?, ?)",
+                    [(tag, scenario_id) for tag in tags],
+                )
+                keys.append(key)
+        return keys
+
+    def load(self, names: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        # Assumptions keyed by stored name, in the order requested; unknown names are skipped
+        found = {}
+        with self._connect() as conn:
+            for i in range(0, len(names), _IN_BATCH):
+                batch = list(names[i:i + _IN_BATCH])
+                marks = ",".join("?" * len(batch))
+                for name, payload in conn.execute(f"SELECT name, assumptions FROM scenarios WHERE name IN ({marks})", batch):
+                    found[name.lower()] = (name, payload)
+        out = {}
+        for name in names:
+            if name.lower() in found:
+                stored, payload = found[name.lower()]
+                out[stored] = json.loads(payload)
+        return out
+
+    def search(
+        self, text: str = "", tags: Sequence[str] = (), input_hash: Optional[str] = None, limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        # Name substring (case-insensitive) AND every tag AND the exact hash; newest first
+        where, args = [], []
+        if text:
+            where.append("s.name LIKE ? ESCAPE '\\'")
+            args.append("%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        for tag in tags:
+            where.append("EXISTS (SELECT 1 FROM scenario_tags t WHERE t.tag = ? AND t.scenario_id = s.id)")
+            args.append(tag)
+        if input_hash:
+            where.append("s.input_hash = ?")
+            args.append(input_hash)
+        sql = (
+            "SELECT s.name, COALESCE((SELECT group_concat(tag, ', ') FROM scenario_tags t WHERE t.scenario_id = s.id), '') AS tags, "
+            "s.input_hash, s.updated FROM scenarios s"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY s.updated DESC, s.name"
+            + (" LIMIT ?" if limit else "")
+        )
+        if limit:
+            args.append(int(limit))
+        with self._connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        frame = pd.DataFrame(rows, columns=["name", "tags", "input_hash", "updated"])
+        frame["updated"] = pd.to_datetime(frame["updated"], unit="s")
+        return frame
+
+    def tags(self) -> list:
+        with self._connect() as conn:
+            return [tag for (tag,) in conn.execute("SELECT DISTINCT tag FROM scenario_tags ORDER BY tag")]
+
+    def delete(self, names: Sequence[str]) -> int:
+        removed = 0
+        with self._connect() as conn:
+            for i in range(0, len(names), _IN_BATCH):
+                batch = list(names[i:i + _IN_BATCH])
+                marks = ",".join("?" * len(batch))
+                removed += conn.execute(f"DELETE FROM scenarios WHERE name IN ({marks})", batch).rowcount
+        return removed
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+
+SCENARIO_LIBRARY = ScenarioLibrary(os.environ.get("MSF_SCENARIO_DB", ".scenarios.db"))
@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def weighted_percentiles(values: np.ndarray, weights: np.ndarray, q) -> np.ndarray:
+    # Inverse of the weighted empirical CDF, made monotone when weights are negative
+    order = np.argsort(values)
+    cdf = np.maximum.accumulate(np.cumsum(weights[order]))
+    cdf = cdf / cdf[-1]
+    index = np.minimum(np.searchsorted(cdf, np.asarray(q, dtype=float) / 100.0), len(values) - 1)
+    return np.asarray(values)[order][index]
+
+
+class StoredRun:
+    """One stored result set: a directory of .npy columns opened as read-only memmaps.
+
+    Indexing and slicing return views of the mapped files, so nothing is read
+    from disk until the values are used.
+    """
+
+    def __init__(self, path: Path, meta: Dict[str, Any]):
+        self.path = path
+        self.meta = meta
+        self.key = meta["key"]
+        self._columns = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in meta["columns"]}
+        self._percentiles: Dict[Tuple[str, Tuple[float, ...]], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.meta["length"]
+
+    def __getitem__(self, name: str) -> np.memmap:
+        return self._columns[name]
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns)
+
+    def frame(self, columns: Optional[Sequence[str]] = None, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        # Copies the requested rows; 2-D columns (e.g. per-month draws) are left out
+        names = [c for c in (columns or self.columns) if self._columns[c].ndim == 1]
+        return pd.DataFrame({name: np.asarray(self._columns[name][start:stop]) for name in names})
+
+    def percentiles(self, name: str, q: Sequence[float], weights: Optional[str] = None) -> np.ndarray:
+        # weights names a column of per-row weights (e.g. control-variate weights)
+        key = (name, tuple(q), weights)
+        if key not in self._percentiles:
+            if weights is None:
+                self._percentiles[key] = np.percentile(self._columns[name], q)
+            else:
+                self._percentiles[key] = weighted_percentiles(self._columns[name], self._columns[weights], q)
+        return self._percentiles[key]
+
+    def histogram(
+        self, name: str, bins: int = 60, block: int = 1_000_000, weights: Optional[str] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Two passes over fixed-size slices, so memory does not grow with the run length.
+        # With weights, counts are the weighted shares scaled to the run length
+        values = self._columns[name]
+        lo = min(float(values[i:i + block].min()) for i in range(0, len(values), block))
+        hi = max(float(values[i:i + block].max()) for i in range(0, len(values), block))
+        edges = np.linspace(lo, hi if hi > lo else lo + 1.0, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64 if weights is None else float)
+        for i in range(0, len(values), block):
+            w = None if weights is None else self._columns[weights][i:i + block]
+            counts += np.histogram(values[i:i + block], bins=edges, weights=w)[0]
+        if weights is not None:
+            counts = np.maximum(counts, 0.0) * len(values)
+        return edges, counts
+
+    def to_csv(self, buf, columns: Optional[Sequence[str]] = None, block: int = 250_000) -> None:
+        for start in range(0, len(self), block):
+            self.frame(columns, start, start + block).to_csv(buf, header=start == 0, index=False)
+
+
+class ResultStore:
+    """Directory of StoredRun entries keyed by a caller-supplied hash.
+
+    Entries are written to a temporary directory and renamed into place, so a
+    crashed or concurrent writer never leaves a half-written run behind. When the
+    total size exceeds max_bytes the least recently opened runs are deleted.
+    """
+
+    def __init__(self, root, max_bytes: int = 2_000_000_000):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[StoredRun]:
+        meta_path = self.root / key / "meta.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            os.utime(meta_path)  # last use, for eviction
+        except (OSError, ValueError):
+            return None
+        return StoredRun(self.root / key, meta)
+
+    @contextmanager
+    def writer(
+        self, key: str, length: int, columns: Dict[str, Tuple[Any, tuple]], meta: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Dict[str, np.memmap]]:
+        # columns maps name -> (dtype, trailing shape); yields writable memmaps of `length` rows
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".tmp-{key}-{uuid.uuid4().hex}"
+        tmp.mkdir()
+        try:
+            out = {
+                name: np.lib.format.open_memmap(tmp / f"{name}.npy", mode="w+", dtype=dtype, shape=(length, *shape))
+                for name, (dtype, shape) in columns.items()
+            }
+            yield out
+            for array in out.values():
+                array.flush()
+            del out
+            info = {"key": key, "length": length, "columns": list(columns), "created": time.time(), **(meta or {})}
+            (tmp / "meta.json").write_text(json.dumps(info), encoding="utf-8")
+            try:
+                os.replace(tmp, self.root / key)
+            except OSError:
+                # Another writer stored the same key first; results are identical
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+
+    def _entries(self) -> list:
+        entries = []
+        if self.root.exists():
+            for path in self.root.iterdir():
+                meta_path = path / "meta.json"
+                if path.is_dir() and not path.name.startswith(".") and meta_path.exists():
+                    size = sum(f.stat().st_size for f in path.iterdir())
+                    entries.append((meta_path.stat().st_mtime, size, path))
+        return sorted(entries)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path.name == keep:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {"runs": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, path in self._entries():
+                shutil.rmtree(path, ignore_errors=True)
+
+
+MC_STORE = ResultStore(
+    os.environ.get("MSF_MC_STORE", ".mc_store"),
+    max_bytes=int(float(os.environ.get("MSF_MC_STORE_MAX_BYTES", 2e9))),
+)
@@ -0,0 +1,118 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+
+class Profiler:
+    """Per-stage wall time, call counts and (optionally) allocation sizes.
+
+    Disabled by default; stage() is then a cheap no-op. Aggregates are shared by
+    all sessions of the process, recent spans are kept for a Chrome trace export.
+    """
+
+    def __init__(self, enabled: bool = False, track_memory: bool = False, max_events: int = 10_000):
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._events: deque = deque(maxlen=max_events)
+        self._origin = time.perf_counter()
+
+    def _frames(self) -> list:
+        if not hasattr(self._local, "frames"):
+            self._local.frames = []
+        return self._local.frames
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        memory = self.track_memory and tracemalloc.is_tracing()
+        frames = self._frames()
+        frame = {"start_mem": 0, "peak": 0}
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if frames:
+                frames[-1]["peak"] = max(frames[-1]["peak"], peak)
+            frame["start_mem"] = current
+            tracemalloc.reset_peak()
+        frames.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            frames.pop()
+            alloc = 0
+            if memory:
+                frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                alloc = max(frame["peak"] - frame["start_mem"], 0)
+                # Nested stages reset the peak, so hand ours up to the enclosing stage
+                if frames:
+                    frames[-1]["peak"] = max(frames[-1]["peak"], frame["peak"])
+                tracemalloc.reset_peak()
+            self._record(name, start, elapsed, alloc)
+
+    def _record(self, name: str, start: float, elapsed: float, alloc: int) -> None:
+        with self._lock:
+            s = self._stats.setdefault(name, {"calls": 0, "total_s": 0.0, "max_s": 0.0, "alloc_peak_mb": 0.0})
+            s["calls"] += 1
+            s["total_s"] += elapsed
+            s["max_s"] = max(s["max_s"], elapsed)
+            s["alloc_peak_mb"] = max(s["alloc_peak_mb"], alloc / 1e6)
+            self._events.append((name, start - self._origin, elapsed, threading.get_ident()))
+
+    def timed(self, name: str) -> Callable:
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def enable(self, track_memory: bool = False) -> None:
+        self.enabled = True
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(s, mean_s=s["total_s"] / s["calls"]) for name, s in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._events.clear()
+
+    def to_json(self, **extra: Any) -> str:
+        return json.dumps({"stages": self.stats(), **extra}, indent=2)
+
+    def to_chrome_trace(self) -> str:
+        # Trace Event Format, loadable in chrome://tracing or Perfetto
+        with self._lock:
+            events = list(self._events)
+        return json.dumps({
+            "traceEvents": [
+                {"name": name, "ph": "X", "ts": start * 1e6, "dur": elapsed * 1e6, "pid": os.getpid(), "tid": tid}
+                for name, start, elapsed, tid in events
+            ]
+        })
+
+
+PROFILER = Profiler(enabled=os.environ.get("MSF_PROFILE", "") not in ("", "0"))